@@ -0,0 +1,122 @@
+"""
+Benchmark samotného parsování + dispatche v BankController.process_command.
+Handlery jsou nahrazené prázdnými funkcemi, takže se neměří úložiště ani síť.
+Pro srovnání obsahuje i původní if-řetězec se split() (stejné chybové
+odpovědi jako původní process_command) a tabulku bez metrik.
+Varianty se měří střídavě v každém opakování, aby je šum sdíleného stroje
+zasáhl stejně; výstup ukazuje poměr k if-řetězci.
+Spuštění:  python bench/bench_dispatch.py [--count 200000]
+"""
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic import BankController
+from shared import i18n
+
+COMMANDS = [
+    "BC", "BA", "BN", "AC",
+    "AD 12345/127.0.0.1 500", "AW 12345/127.0.0.1 200",
+    "AB 12345/127.0.0.1", "AR 12345/127.0.0.1",
+    "AB 12345/10.0.0.99", "XX neznamy", "AB\t12345/127.0.0.1",
+]
+
+
+class _NoMetric:
+    """Náhrada histogramu/čítače - pro měření dispatche bez instrumentace."""
+    def observe(self, value, weight=1):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+
+def _noop(*args):
+    return "OK"
+
+
+def legacy_dispatch(raw_command):
+    """Původní parsování (split + if-řetězec) s voláním prázdného handleru."""
+    if not raw_command:
+        return ""
+    parts = raw_command.strip().split()
+    if not parts:
+        return ""
+    cmd_code = parts[0].upper()
+    try:
+        if cmd_code == "BC": return _noop()
+        if cmd_code == "BN": return _noop()
+        if cmd_code == "BA": return _noop()
+        if cmd_code == "AC": return _noop()
+        if cmd_code == "RP": return _noop(int(parts[1]) if len(parts) > 1 else 0)
+        if cmd_code in ["AD", "AW", "AB", "AR"]:
+            if len(parts) < 2 or '/' not in parts[1]:
+                return i18n.get("ERR_INVALID_FORMAT")
+            acc_num_str, target_ip = parts[1].split('/')
+            amount = None
+            if cmd_code in ["AD", "AW"]:
+                if len(parts) < 3: return i18n.get("ERR_INVALID_FORMAT")
+                amount = int(parts[2])
+            return _noop(cmd_code, acc_num_str, target_ip, amount)
+        return i18n.get("ERR_UNKNOWN_CMD")
+    except Exception as e:
+        return f"{i18n.get('ERR_INTERNAL')} ({str(e)})"
+
+
+def run(variants, count, repeat):
+    """
+    Každé opakování změří všechny varianty po sobě; bere se nejlepší čas
+    (na sdíleném stroji je šum velký). První varianta je základ poměru.
+    """
+    commands = COMMANDS * (count // len(COMMANDS))
+    best = {label: float("inf") for label, _ in variants}
+    for _ in range(repeat):
+        for label, dispatch in variants:
+            started = time.perf_counter()
+            for command in commands:
+                dispatch(command)
+            best[label] = min(best[label], time.perf_counter() - started)
+    baseline = best[variants[0][0]]
+    for label, _ in variants:
+        ns = best[label] * 1e9 / len(commands)
+        ratio = f"  {best[label] / baseline:.2f}x if-chain" if label != variants[0][0] else ""
+        print(f"{label:<28} {len(commands) / best[label]:>12,.0f} cmd/s  ({ns:.0f} ns/cmd){ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        controller = BankController(os.path.join(tmp, "data.json"))
+        controller.net_client = None
+        # Prázdné handlery se stejnými deklarovanými argumenty
+        for code, spec in list(controller._commands.items()):
+            controller.register_command(code, lambda raw, args, code=code: code,
+                                        spec.arg_types, len(spec.arg_types) - spec.required,
+                                        spec.proxyable, spec.latency_sample)
+
+        # Druhý controller se stejnými příkazy, ale bez metrik
+        bare = BankController(os.path.join(tmp, "bare.json"))
+        bare.net_client = None
+        bare._commands = {code: copy.copy(spec) for code, spec in controller._commands.items()}
+        for spec in bare._commands.values():
+            spec.latency = spec.errors = _NoMetric()
+        bare._unknown_commands = _NoMetric()
+
+        run([("legacy if-chain + split()", legacy_dispatch),
+             ("dispatch table", controller.process_command),
+             ("dispatch table bez metrik", bare.process_command)], args.count, args.repeat)
+        bare.storage.close()
+        controller.storage.close()
+
+
+if __name__ == "__main__":
+    main()
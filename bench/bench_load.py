@@ -0,0 +1,300 @@
+"""
+Zátěžový test bankovního uzlu přes TCP.
+Na localhostu spustí topologii několika uzlů (127.0.0.2:65525, 127.0.0.3:65526, ...),
+každý s vlastním dočasným data.json, a první uzel zatíží paralelními klienty.
+Mix příkazů: AC/AD/AW/AB/BA/BN + PX (AD/AB na účet jiného uzlu = proxy).
+Po zátěži změří RP (z cache i s FRESH). Vypisuje propustnost, p50/p99 a chyby;
+--json uloží výsledky a --baseline je porovná s dřívějším během (regrese -> exit 1).
+Spuštění:  python bench/bench_load.py [--accounts 1000 100000 1000000] [--clients 16] [--duration 5]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic import BankController
+from network import AsyncBankServer, BankServer
+from shared import LineBuffer
+
+FIRST_PORT = 65525
+LAST_PORT = 65535
+FIRST_ACCOUNT = 100000  # Mimo rozsah AC (10000-99999), aby AC mělo volná čísla
+START_BALANCE = 1_000_000
+DEFAULT_MIX = "AC=1,AD=4,AW=3,AB=6,BA=1,BN=1,PX=2"
+
+
+class BenchNode:
+    """Jeden uzel topologie: BankController + server na vlastní IP a portu."""
+
+    def __init__(self, index, accounts, engine, workers, topology, durability="strict"):
+        self.ip = f"127.0.0.{index + 2}"  # 127.0.0.1 považuje controller vždy za lokální
+        self.port = FIRST_PORT + index
+        self.accounts = accounts
+        self.workdir = tempfile.mkdtemp(prefix=f"bank-bench-{index}-")
+        data_file = os.path.join(self.workdir, "data.json")
+        with open(data_file, "w", encoding="utf-8") as f:
+            json.dump({str(FIRST_ACCOUNT + i): START_BALANCE for i in range(accounts)}, f)
+
+        self.controller = BankController(data_file, my_ip=self.ip, durability=durability)
+        self.load_time = self.controller.load_time
+
+        # Ostatní uzly jsou na jiných portech -> peers.txt ve tvaru IP:PORT
+        peers_file = os.path.join(self.workdir, "peers.txt")
+        with open(peers_file, "w") as f:
+            f.writelines(f"{ip}:{port}\n" for ip, port in topology if ip != self.ip)
+        if self.controller.robber:
+            self.controller.robber.peers_file = peers_file
+        if self.controller.net_client:
+            self.controller.net_client.peer_ports.update(topology)
+
+        if engine == "async":
+            self.server = AsyncBankServer(self.ip, self.port, self.controller, timeout=60.0)
+        else:
+            self.server = BankServer(self.ip, self.port, self.controller, timeout=60.0,
+                                     workers=workers, backlog=128)
+        threading.Thread(target=self.server.start, daemon=True).start()
+        self._wait_ready()
+
+    def _wait_ready(self, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection((self.ip, self.port), timeout=0.5).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError(f"Uzel {self.ip}:{self.port} nenaběhl")
+
+    def account(self, rng):
+        return f"{FIRST_ACCOUNT + rng.randrange(self.accounts)}/{self.ip}"
+
+    def close(self):
+        self.server.stop()
+        if self.controller.net_client:
+            self.controller.net_client.close()
+        self.controller.storage.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class Client:
+    """Jedno keep-alive spojení: příkaz -> řádek odpovědi."""
+
+    def __init__(self, ip, port):
+        self.sock = socket.create_connection((ip, port), timeout=30.0)
+        self.buffer = LineBuffer()
+        self.pending = []
+
+    def call(self, command):
+        self.sock.sendall(command.encode("utf-8") + b"\n")
+        while not self.pending:
+            data = self.sock.recv(4096)
+            if not data:
+                raise ConnectionError("server zavřel spojení")
+            self.pending.extend(self.buffer.feed(data))
+        return self.pending.pop(0)
+
+    def close(self):
+        self.sock.close()
+
+
+def make_command(code, rng, node, peers):
+    if code == "AC" or code == "BA" or code == "BN":
+        return code
+    if code == "AD":
+        return f"AD {node.account(rng)} {rng.randint(1, 100)}"
+    if code == "AW":
+        return f"AW {node.account(rng)} {rng.randint(1, 100)}"
+    if code == "AB":
+        return f"AB {node.account(rng)}"
+    if code == "PX":
+        peer = rng.choice(peers)
+        if rng.random() < 0.5:
+            return f"AD {peer.account(rng)} {rng.randint(1, 100)}"
+        return f"AB {peer.account(rng)}"
+    raise ValueError(code)
+
+
+def worker(worker_id, args, mix, node, peers, stop_at, results):
+    rng = random.Random(args.seed * 1000 + worker_id)
+    codes = [code for code, _ in mix]
+    weights = [weight for _, weight in mix]
+    latencies = {code: [] for code in codes}
+    errors = {code: 0 for code in codes}
+    client = Client(node.ip, node.port)
+    try:
+        while time.perf_counter() < stop_at:
+            code = rng.choices(codes, weights)[0]
+            command = make_command(code, rng, node, peers)
+            started = time.perf_counter()
+            response = client.call(command)
+            latencies[code].append(time.perf_counter() - started)
+            if response.startswith("ER"):
+                errors[code] += 1
+    finally:
+        client.close()
+    results[worker_id] = (latencies, errors)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {"ops": len(values), "ops_per_s": len(values) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(values, 0.50) * 1000, "p99_ms": percentile(values, 0.99) * 1000,
+            "errors": errors}
+
+
+def run_load(args, mix, nodes):
+    """Zátěž na první uzel, vrací {kód: souhrn} + "ALL"."""
+    results = {}
+    stop_at = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=worker,
+                                args=(i, args, mix, nodes[0], nodes[1:] or nodes, stop_at, results))
+               for i in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    report = {}
+    all_latencies, all_errors = [], 0
+    for code, _ in mix:
+        latencies = [value for lat, _ in results.values() for value in lat[code]]
+        errors = sum(err[code] for _, err in results.values())
+        report[code] = summarize(latencies, errors, elapsed)
+        all_latencies.extend(latencies)
+        all_errors += errors
+    report["ALL"] = summarize(all_latencies, all_errors, elapsed)
+    return report
+
+
+def run_rp(args, nodes):
+    """RP přes síť: FRESH (sken všech uzlů) a následně z cache."""
+    report = {}
+    client = Client(nodes[0].ip, nodes[0].port)
+    try:
+        target = START_BALANCE * 3
+        for code, command in (("RP FRESH", f"RP {target} FRESH"), ("RP", f"RP {target}")):
+            latencies, errors = [], 0
+            started = time.perf_counter()
+            for _ in range(args.rp_runs):
+                t0 = time.perf_counter()
+                response = client.call(command)
+                latencies.append(time.perf_counter() - t0)
+                errors += response.startswith("ER")
+            report[code] = summarize(latencies, errors, time.perf_counter() - started)
+    finally:
+        client.close()
+    return report
+
+
+def print_report(accounts, load_time, report):
+    print(f"\n== {accounts} účtů (načtení {load_time * 1000:.0f} ms) ==")
+    print(f"{'cmd':>8} | {'ops':>8} {'ops/s':>9} | {'p50 ms':>8} {'p99 ms':>8} | {'errors':>6}")
+    for code, row in report.items():
+        print(f"{code:>8} | {row['ops']:>8} {row['ops_per_s']:>9.0f} | "
+              f"{row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f} | {row['errors']:>6}")
+
+
+def compare(baseline, results, tolerance):
+    """Vrátí seznam regresí oproti baseline (propustnost dolů / p99 nahoru o víc než tolerance)."""
+    regressions = []
+    for accounts, report in results.items():
+        for code, row in report.items():
+            old = baseline.get(accounts, {}).get(code)
+            if not old or not old["ops"]:
+                continue
+            if row["ops_per_s"] < old["ops_per_s"] * (1 - tolerance):
+                regressions.append(f"{accounts}/{code}: ops/s {old['ops_per_s']:.0f} -> {row['ops_per_s']:.0f}")
+            if row["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+                regressions.append(f"{accounts}/{code}: p99 {old['p99_ms']:.3f} -> {row['p99_ms']:.3f} ms")
+            if row["errors"] > old["errors"]:
+                regressions.append(f"{accounts}/{code}: errors {old['errors']} -> {row['errors']}")
+    return regressions
+
+
+def parse_mix(text):
+    mix = []
+    for item in text.split(","):
+        code, _, weight = item.partition("=")
+        mix.append((code.strip().upper(), float(weight or 1)))
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, nargs="+", default=[1000, 10_000, 100_000, 1_000_000],
+                        help="počty účtů na hlavním uzlu (každý počet = samostatný běh)")
+    parser.add_argument("--peer-accounts", type=int, default=1000, help="účty na ostatních uzlech")
+    parser.add_argument("--nodes", type=int, default=3,
+                        help=f"počet uzlů (porty {FIRST_PORT}-{LAST_PORT})")
+    parser.add_argument("--clients", type=int, default=16, help="souběžní klienti")
+    parser.add_argument("--duration", type=float, default=5.0, help="délka zátěže v sekundách")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="váhy příkazů, např. AB=6,AD=4,PX=2")
+    parser.add_argument("--rp-runs", type=int, default=5, help="počet RP v každé variantě (0 = bez RP)")
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread")
+    parser.add_argument("--workers", type=int, default=None, help="pool workerů BankServer (výchozí: vlákno/klient)")
+    parser.add_argument("--durability", choices=["strict", "group", "relaxed"], default="strict",
+                        help="trvanlivost zápisů úložiště (viz LedgerStorage)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="uloží výsledky do souboru")
+    parser.add_argument("--baseline", help="porovná s výsledky dřívějšího --json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="povolené zhoršení (0.2 = 20 %%)")
+    args = parser.parse_args()
+
+    if not 1 <= args.nodes <= LAST_PORT - FIRST_PORT + 1:
+        parser.error(f"--nodes musí být 1-{LAST_PORT - FIRST_PORT + 1}")
+    mix = parse_mix(args.mix)
+    if args.nodes == 1:
+        mix = [(code, weight) for code, weight in mix if code != "PX"]
+
+    logging.basicConfig(level=logging.WARNING)  # Bez výpisu každého spojení
+    topology = [(f"127.0.0.{i + 2}", FIRST_PORT + i) for i in range(args.nodes)]
+
+    results = {}
+    for accounts in args.accounts:
+        nodes = []
+        try:
+            for index in range(args.nodes):
+                nodes.append(BenchNode(index, accounts if index == 0 else args.peer_accounts,
+                                       args.engine, args.workers, topology, args.durability))
+            report = run_load(args, mix, nodes)
+            if args.rp_runs and args.nodes > 1:
+                report.update(run_rp(args, nodes))
+        finally:
+            for node in nodes:
+                node.close()
+        print_report(accounts, nodes[0].load_time, report)
+        results[str(accounts)] = report
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for line in regressions:
+            print("REGRESE:", line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Mikro-benchmark výběru bank pro RP: původní greedy vs. robbery_solver.solve.
+Spuštění:  python bench/bench_robbery.py [--runs 20] [--seed 1]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from robbery_solver import greedy, solve
+
+
+def random_network(rng, size):
+    """Náhodná síť bank: peníze 1-100k, klienti 1-200 (občas banka bez klientů)."""
+    return [{'ip': f"10.0.{i // 256}.{i % 256}",
+             'money': rng.randint(1, 100_000),
+             'clients': rng.choice([0] + [rng.randint(1, 200)] * 19)}
+            for i in range(size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=20, help="počet instancí na velikost")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 30, 100, 300, 1000])
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'banks':>6} | {'greedy ms':>9} {'solve ms':>9} | "
+          f"{'greedy victims':>14} {'solve victims':>13} {'saved':>6} | {'optimal':>7} {'max gap':>7}")
+    for size in args.sizes:
+        greedy_time = solve_time = 0.0
+        greedy_victims = solve_victims = 0
+        optimal = 0
+        max_gap = 0.0
+        for _ in range(args.runs):
+            network = random_network(rng, size)
+            target = rng.randint(1, sum(b['money'] for b in network) // 2)
+
+            started = time.perf_counter()
+            baseline = greedy(network, target)
+            greedy_time += time.perf_counter() - started
+
+            started = time.perf_counter()
+            plan = solve(network, target)
+            solve_time += time.perf_counter() - started
+
+            assert plan.money >= target
+            greedy_victims += baseline.victims
+            solve_victims += plan.victims
+            optimal += plan.optimal
+            max_gap = max(max_gap, plan.gap)
+
+        saved = 1 - solve_victims / greedy_victims if greedy_victims else 0.0
+        print(f"{size:>6} | {greedy_time / args.runs * 1000:>9.3f} {solve_time / args.runs * 1000:>9.3f} | "
+              f"{greedy_victims / args.runs:>14.1f} {solve_victims / args.runs:>13.1f} {saved:>6.1%} | "
+              f"{optimal:>3}/{args.runs:<3} {max_gap:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
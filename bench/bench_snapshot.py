@@ -0,0 +1,72 @@
+"""
+Srovnání formátů snapshotu účtů: JSON (ThreadSafeJsonStorage) vs. binární (BinarySnapshotStorage).
+Měří uložení, načtení, velikost souboru a bodové čtení jednoho účtu
+(binární: mmap + BinarySnapshot.get, JSON: nezbývá než načíst celý soubor).
+Spuštění:  python bench/bench_snapshot.py [--accounts 1000000] [--lookups 10000]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import ThreadSafeJsonStorage
+from storage import BinarySnapshot, BinarySnapshotStorage
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--lookups", type=int, default=10_000, help="počet bodových čtení z mmap")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bank-snapshot-")
+
+    print(f"{'accounts':>9} | {'format':>6} | {'save ms':>8} {'load ms':>8} {'size MB':>8} | {'lookup us':>9}")
+    try:
+        for count in args.accounts:
+            # Seřazená čísla: tak účty drží LedgerStorage po načtení snapshotu
+            numbers = sorted(rng.sample(range(10_000, 10_000 + count * 4), count))
+            data = {str(n): rng.randint(0, 10_000_000) for n in numbers}
+            probes = [str(n) for n in rng.choices(numbers, k=args.lookups)]
+
+            json_storage = ThreadSafeJsonStorage(os.path.join(workdir, "data.json"))
+            _, json_save = timed(json_storage.save, data)
+            loaded, json_load = timed(json_storage.load)
+            assert loaded == data
+            json_size = os.path.getsize(json_storage.filename)
+
+            binary_storage = BinarySnapshotStorage(os.path.join(workdir, "data.bin"))
+            _, binary_save = timed(binary_storage.save, data)
+            loaded, binary_load = timed(binary_storage.load)
+            assert loaded == data
+            binary_size = os.path.getsize(binary_storage.filename)
+
+            # Bodové čtení bez načtení celého souboru (mmap + půlení intervalu)
+            with BinarySnapshot(binary_storage.filename) as snapshot:
+                started = time.perf_counter()
+                for acc_num in probes:
+                    assert snapshot.get(acc_num) == data[acc_num]
+                lookup = (time.perf_counter() - started) / len(probes)
+
+            print(f"{count:>9} | {'json':>6} | {json_save * 1000:>8.1f} {json_load * 1000:>8.1f} "
+                  f"{json_size / 2**20:>8.2f} | {json_load * 1e6:>9.0f}")
+            print(f"{count:>9} | {'binary':>6} | {binary_save * 1000:>8.1f} {binary_load * 1000:>8.1f} "
+                  f"{binary_size / 2**20:>8.2f} | {lookup * 1e6:>9.2f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
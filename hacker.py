@@ -1,136 +1,767 @@
+import asyncio
+import logging
+import selectors
 import socket
+import threading
 import time
-from shared import i18n
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from shared import i18n, LineBuffer, metrics
+from robbery_solver import solve
 
 # Defaultní port, na kterém poslouchají ostatní banky ve třídě.
 # Pokud se ve třídě dohodnete jinak, změň to zde nebo v main.py.
 DEFAULT_TARGET_PORT = 65525
 
+log = logging.getLogger("bank.hacker")
+
+class PooledConnection:
+    """
+    Jedno otevřené (keep-alive) spojení k cizí bance.
+    Drží si vlastní LineBuffer, aby se neztratila data mezi příkazy.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = LineBuffer()
+        self.last_used = time.monotonic()
+
+    def is_healthy(self, idle_timeout):
+        """
+        Health check před znovupoužitím: spojení nesmí být příliš dlouho nečinné
+        a nesmí na něm nic čekat (čitelný socket = protistrana zavřela nebo poslala smetí).
+        """
+        if time.monotonic() - self.last_used > idle_timeout:
+            return False
+        try:
+            readable = _wait_readable(self.sock, 0)
+        except (OSError, ValueError):
+            return False
+        return not readable and not self.buffer.partial
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class PeerHealth:
+    """
+    Zdraví jedné cizí banky: circuit breaker a okno posledních latencí.
+    - closed: volání projdou normálně,
+    - open: po failure_threshold neúspěších v řadě se volání open_seconds
+      vůbec neposílají (okamžité ER místo čekání na timeout),
+    - half-open: po uplynutí open_seconds projde jedno zkušební volání;
+      úspěch okruh zavře, neúspěch ho znovu otevře.
+    Z latencí úspěšných volání se počítá adaptivní timeout a práh pro hedging.
+    """
+    CLOSED, HALF_OPEN, OPEN = "closed", "half-open", "open"
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}  # Hodnota gauge v metrikách
+
+    def __init__(self, ip, failure_threshold=3, open_seconds=10.0, window=100, label=None):
+        self.ip = ip
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.failures = 0          # Neúspěchy v řadě
+        self.opened_at = 0.0
+        self._probing = False      # V half-open už běží zkušební volání
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._state_gauge = metrics.gauge("bank_proxy_circuit_state",
+                                          "Stav okruhu k bance (0 closed, 1 half-open, 2 open)",
+                                          peer=label or ip)
+
+    def allow(self):
+        """Smí se teď na banku volat? V open/half-open pustí jen jedno zkušební volání."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self, latency=None):
+        """
+        Banka odpověděla. latency=None = odpověděla jen na část příkazů
+        (žije, okruh se zavře, ale do okna latencí se nic nezapíše).
+        """
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+            self.failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                log.info("Banka %s opět odpovídá, okruh zavřen.", self.ip)
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    log.warning("Banka %s neodpovídá (%d×), okruh otevřen na %.0f s.",
+                                self.ip, self.failures, self.open_seconds)
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def _set_state(self, state):
+        self.state = state
+        self._state_gauge.set(self.STATE_VALUES[state])
+
+    def latency_quantile(self, q, min_samples):
+        """Kvantil latence z okna posledních úspěšných volání (None = málo dat)."""
+        with self._lock:
+            if len(self._latencies) < min_samples:
+                return None
+            values = sorted(self._latencies)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _wait_readable(sock, timeout):
+    """Počká nejvýš timeout sekund, až půjde ze socketu číst (selectors zvládnou i fd >= 1024)."""
+    with selectors.DefaultSelector() as selector:
+        selector.register(sock, selectors.EVENT_READ)
+        return bool(selector.select(timeout))
+
+
+class _HedgedRead:
+    """
+    Stav jednoho hedgovaného čtení (viz NetworkClient._send_hedged).
+    Primární odeslání běží ve volajícím vlákně; záložní (z executoru) ho smí
+    přerušit shutdownem socketu, dokud primární nedočetlo.
+    """
+    def __init__(self, hedge_after, start_hedge):
+        self.hedge_after = hedge_after
+        self._start_hedge = start_hedge
+        self.hedge = None        # Future záložního volání
+        self.cancelled = False
+        self._finished = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def sent(self, conn):
+        """
+        Primární příkazy jsou odeslané; když do hedge_after nepřijde odpověď,
+        spustí záložní volání. Vrací False, pokud už záložní vyhrálo.
+        """
+        with self._lock:
+            if self.cancelled:
+                return False
+            self._conn = conn
+        if self.hedge is None and not _wait_readable(conn.sock, self.hedge_after):
+            self.hedge = self._start_hedge()
+            self.hedge.add_done_callback(self._hedge_done)
+        return True
+
+    def _hedge_done(self, future):
+        if future.result()[1]:
+            return  # Záložní selhalo, primární čeká dál
+        with self._lock:
+            if self._finished:
+                return
+            self.cancelled = True
+            conn = self._conn
+        if conn:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)  # Probudí recv() primárního volání
+            except OSError:
+                pass
+
+    def finish(self):
+        """Primární dočetlo, od teď ho nejde přerušit. False = záložní bylo rychlejší."""
+        with self._lock:
+            self._finished = True
+            return not self.cancelled
+
+
 class NetworkClient:
     """
     Třída pro komunikaci s ostatními uzly (bankami).
-    Otevírá klientské sockety (TCP connect).
+    Otevírá klientské sockety (TCP connect) a drží je v poolu
+    pro další příkazy (max. pool_size nečinných spojení na jednu banku).
+    peer_ports = {ip: port} pro banky mimo DEFAULT_TARGET_PORT
+    (např. více uzlů na jednom stroji, viz peers.txt ve tvaru IP:PORT).
+
+    Ochrana před nedostupnými bankami (viz PeerHealth):
+    - circuit breaker: po failure_threshold chybách v řadě se na banku
+      open_seconds nevolá a příkaz hned vrátí ER,
+    - adaptivní timeout: čtení (AB/BA/BN) se známými latencemi (aspoň min_samples)
+      čekají nejvýš timeout_factor × p99, v mezích min_timeout .. timeout;
+      zápisy (AD/AW/AR/AX...) čekají vždy celý timeout - pomalá banka je
+      mohla provést a předčasné ER by svádělo klienta k opakování,
+    - hedging: čtení (AB/BA/BN) bez odpovědi do p95 latence (nejméně
+      hedge_min_delay) se pošle podruhé a platí první odpověď (hedge=False vypne).
+    Stav (PeerHealth) se drží nejvýš pro max_peers bank a stejně tolik jich má
+    v metrikách vlastní štítek peer - cílovou IP volí klient v příkazu.
     """
-    def __init__(self, timeout=5):
+    IDEMPOTENT = ("AB", "BA", "BN")  # Příkazy, které je bezpečné poslat dvakrát
+
+    def __init__(self, timeout=5, pool_size=4, idle_timeout=20.0, failure_threshold=3,
+                 open_seconds=10.0, min_timeout=0.25, timeout_factor=3.0, min_samples=20,
+                 hedge=True, hedge_quantile=0.95, hedge_min_delay=0.02, hedge_workers=32,
+                 max_peers=1024):
         self.timeout = timeout
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.min_timeout = min_timeout
+        self.timeout_factor = timeout_factor
+        self.min_samples = min_samples
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.max_peers = max_peers
+        self.peer_ports = {}
+        self._pools = {}  # (ip, port) -> deque[PooledConnection]
+        self._pool_lock = threading.Lock()
+        self._health = OrderedDict()  # ip -> PeerHealth, nejdéle nepoužitá na začátku
+        self._health_lock = threading.Lock()
+        self._peer_labels = set()  # IP, které mají v metrikách vlastní štítek peer
+        self._label_lock = threading.Lock()
+        self._hedge_executor = ThreadPoolExecutor(max_workers=hedge_workers,
+                                                  thread_name_prefix="proxy-hedge")
+
+    def _checkout(self, key, timeout):
+        """Vrátí (spojení, bylo_v_poolu). Nezdravá a prošlá spojení zahodí."""
+        with self._pool_lock:
+            pool = self._pools.get(key)
+            while pool:
+                conn = pool.pop() # Nejčerstvější spojení
+                if conn.is_healthy(self.idle_timeout):
+                    conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+
+        sock = socket.create_connection(key, timeout=timeout)
+        return PooledConnection(sock), False
+
+    def _checkin(self, key, conn):
+        """Vrátí spojení do poolu (nebo ho zavře, když je pool plný)."""
+        conn.last_used = time.monotonic()
+        with self._pool_lock:
+            pool = self._pools.setdefault(key, deque())
+            # Idle eviction: nejstarší spojení jsou na začátku fronty
+            while pool and not pool[0].is_healthy(self.idle_timeout):
+                pool.popleft().close()
+            if len(pool) < self.pool_size:
+                pool.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Zavře všechna spojení v poolu."""
+        with self._pool_lock:
+            for pool in self._pools.values():
+                while pool:
+                    pool.pop().close()
+            self._pools.clear()
+        self._hedge_executor.shutdown(wait=False)
+
+    def port_for(self, target_ip):
+        return self.peer_ports.get(target_ip, DEFAULT_TARGET_PORT)
+
+    def health(self, target_ip):
+        """
+        PeerHealth banky (vytvoří se při prvním volání).
+        Drží se nejvýš max_peers bank, nejdéle nepoužitá vypadne.
+        """
+        with self._health_lock:
+            health = self._health.get(target_ip)
+            if health is None:
+                health = PeerHealth(target_ip, self.failure_threshold, self.open_seconds,
+                                    label=self._peer_label(target_ip))
+                self._health[target_ip] = health
+                while len(self._health) > self.max_peers:
+                    self._health.popitem(last=False)
+            else:
+                self._health.move_to_end(target_ip)
+            return health
+
+    def _peer_label(self, target_ip):
+        """
+        Štítek peer pro metriky: vlastní jen pro prvních max_peers bank,
+        ostatní sdílí "other" (IP v příkazu volí klient, štítky se nemažou).
+        """
+        if target_ip in self._peer_labels:
+            return target_ip
+        with self._label_lock:
+            if len(self._peer_labels) < self.max_peers:
+                self._peer_labels.add(target_ip)
+                return target_ip
+        return "other"
+
+    def _timeout_for(self, health, timeout):
+        """Adaptivní timeout: timeout_factor × p99 latence, v mezích min_timeout .. timeout."""
+        p99 = health.latency_quantile(0.99, self.min_samples)
+        if p99 is None:
+            return timeout
+        return max(self.min_timeout, min(timeout, p99 * self.timeout_factor))
 
-    def send_command(self, target_ip, command_text, target_port=DEFAULT_TARGET_PORT):
+    def _is_idempotent(self, commands):
+        return all((cmd.split() or [""])[0].upper() in self.IDEMPOTENT for cmd in commands)
+
+    def _can_resend(self, reused, sent, commands):
+        """
+        Smí se příkaz po chybě na spojení z poolu poslat znovu novým spojením?
+        Jen když selhalo už odeslání, nebo jde o čtení - zápis (AD/AW/AR),
+        který banka přijala a pak spojení zavřela, mohla už provést.
+        """
+        return reused and (not sent or self._is_idempotent(commands))
+
+    def _fast_fail(self, target_ip, count):
+        metrics.counter("bank_proxy_fast_fail_total", "Volání odmítnutá otevřeným okruhem",
+                        peer=self._peer_label(target_ip)).inc()
+        return [f"ER Circuit open ({target_ip} je nedostupná)"] * count
+
+    def send_command(self, target_ip, command_text, target_port=None):
         """
         Pošle textový příkaz na cílovou IP a vrátí odpověď.
-        Řeší připojení, odeslání, čekání na odpověď a odpojení.
+        Řeší připojení, odeslání a čekání na odpověď.
+        """
+        return self.send_commands(target_ip, [command_text], target_port)[0]
+
+    def send_commands(self, target_ip, commands, target_port=None, timeout=None):
+        """
+        Pošle více příkazů jedním zápisem (pipelining) a vrátí seznam odpovědí
+        ve stejném pořadí. Při chybě dostanou nezodpovězené příkazy chybovou odpověď.
+        Spojení z poolu, které mezitím zavřela protistrana, se jednou zkusí znovu.
+        timeout přepíše výchozí timeout klienta jen pro toto volání.
+        Nedostupná banka (otevřený okruh) dostane hned ER bez pokusu o spojení.
         """
-        s = None
+        health = self.health(target_ip)
+        if not health.allow():
+            return self._fast_fail(target_ip, len(commands))
+        idempotent = self._is_idempotent(commands)
+        timeout = timeout or self.timeout
+        if idempotent:
+            timeout = self._timeout_for(health, timeout)
+        key = (target_ip, target_port or self.port_for(target_ip))
+
+        hedge_after = None
+        if self.hedge and health.state == PeerHealth.CLOSED and idempotent:
+            hedge_after = health.latency_quantile(self.hedge_quantile, self.min_samples)
+            if hedge_after is not None:
+                hedge_after = max(hedge_after, self.hedge_min_delay)
+        failed, answered = True, 0
         try:
-            # Vytvoření socketu
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(self.timeout) 
-            
-            # Připojení k cizí bance
-            s.connect((target_ip, target_port))
-            
-            # Odeslání dat (UTF-8, bez zbytečných mezer na konci)
-            msg = command_text.strip()
-            s.sendall(msg.encode('utf-8'))
-            
-            # Čekání na odpověď
-            response = s.recv(1024) # 1KB buffer stačí na tyto zprávy
+            if hedge_after is None:
+                responses, failed, answered = self._send(key, commands, timeout)
+            else:
+                responses, failed, answered = self._send_hedged(key, commands, timeout, hedge_after)
+        finally:
+            # Každý výsledek musí ukončit i případné zkušební volání v half-open,
+            # jinak by okruh zůstal navždy zavřený. Banka, která odpověděla aspoň
+            # na část příkazů (např. starší implementace bez pipeliningu), žije.
+            if failed and not answered:
+                health.record_failure()
+            elif failed:
+                health.record_success()
+        return responses
+
+    def _send_hedged(self, key, commands, timeout, hedge_after):
+        """
+        Pošle čtení ve volajícím vlákně; když do hedge_after nepřijde odpověď,
+        pošle ho executor podruhé (jiným spojením) a platí první úspěšná odpověď.
+        Do executoru jdou jen záložní volání, primární tak nikdy nečeká ve frontě.
+        """
+        call = _HedgedRead(hedge_after, lambda: self._start_hedge(key, commands, timeout))
+        result = self._send(key, commands, timeout, call)
+        if call.hedge is not None and (result is None or result[1]):
+            # Primární přerušené (záložní už má odpověď) nebo neúspěšné
+            hedged = call.hedge.result()
+            if result is None or not hedged[1]:
+                return hedged
+        return result  # Záložní volání doběhne samo (spojení se vrátí do poolu)
+
+    def _start_hedge(self, key, commands, timeout):
+        metrics.counter("bank_proxy_hedges_total", "Zopakovaná (hedged) čtení z cizí banky",
+                        peer=self._peer_label(key[0])).inc()
+        return self._hedge_executor.submit(self._send, key, commands, timeout)
+
+    def _send(self, key, commands, timeout, call=None):
+        """
+        Jedno odeslání příkazů; vrací (odpovědi, selhalo, počet skutečných odpovědí).
+        Odpovědi, které přišly před chybou (např. timeout na druhém příkazu),
+        se zachovají, chybovou odpověď dostanou jen ty nezodpovězené.
+        S call (_HedgedRead) vrací None, když ho přerušilo rychlejší záložní volání.
+        """
+        target_ip = key[0]
+        started = time.perf_counter()
+        # Odeslání dat (UTF-8, každý příkaz na vlastním řádku)
+        payload = "".join(cmd.strip() + "\n" for cmd in commands).encode('utf-8')
+        responses = []
+        conn = None
+        try:
+            for _ in range(2):
+                conn, reused = self._checkout(key, timeout)
+                responses = []
+                sent = False
+                try:
+                    conn.sock.sendall(payload)
+                    sent = True
+                    if call and not call.sent(conn):
+                        break
+                    self._read_responses(conn, len(commands), responses)
+                except (BrokenPipeError, ConnectionResetError):
+                    if not self._can_resend(reused, sent, commands):
+                        raise
+                if responses or not self._can_resend(reused, sent, commands):
+                    break
+                # Staré spojení bylo mrtvé -> reconnect
+                conn.close()
+                conn = None
+
+            if len(responses) == len(commands) and (call is None or call.finish()):
+                self._checkin(key, conn)
+                conn = None
+
+            error = "ER Empty response"
+
+        except socket.timeout:
+            error = f"ER Timeout ({target_ip} neodpovídá)"
+        except ConnectionRefusedError:
+            error = f"ER Connection Refused ({target_ip} neběží)"
+        except Exception as e:
+            error = f"ER Network Error: {str(e)}"
+        finally:
+            if conn:
+                conn.close() # Rozbité nebo nedočtené spojení do poolu nevracíme
+
+        if call and not call.finish():
+            return None  # Přerušeno záložním voláním - není to chyba banky
+        failed = len(responses) < len(commands)
+        self._record(target_ip, started, failed)
+        answered = len(responses)
+        return responses + [error] * (len(commands) - answered), failed, answered
+
+    def _record(self, target_ip, started, failed):
+        """Metriky proxy: latence a chybovost pro každou banku zvlášť; úspěch zapíše do PeerHealth."""
+        elapsed = time.perf_counter() - started
+        label = self._peer_label(target_ip)
+        metrics.histogram("bank_proxy_seconds", "Latence příkazů na cizí banku",
+                          peer=label).observe(elapsed)
+        if failed:
+            metrics.counter("bank_proxy_errors_total", "Neúspěšná volání cizí banky",
+                            peer=label).inc()
+        else:
+            self.health(target_ip).record_success(elapsed)
+
+    def _read_responses(self, conn, count, responses):
+        """
+        Čte, dokud nemá odpověď (řádek) pro každý příkaz, nebo dokud se spojení nezavře.
+        Odpovědi přidává do responses volajícího, takže přežijí i timeout uprostřed čtení.
+        """
+        while len(responses) < count:
+            data = conn.sock.recv(4096)
+            if not data:
+                # Odpověď bez '\n' na konci (starší implementace)
+                if conn.buffer.partial:
+                    responses.append(conn.buffer.take_partial())
+                break
+            responses.extend(line for line in conn.buffer.feed(data) if line)
+        del responses[count:]
+
+    async def send_command_async(self, target_ip, command_text, target_port=None):
+        """
+        Neblokující varianta send_command pro asyncio server.
+        Během čekání na cizí banku nedrží žádné vlákno.
+        Circuit breaker a adaptivní timeout (jen čtení) platí stejně jako u send_commands.
+        """
+        health = self.health(target_ip)
+        if not health.allow():
+            return self._fast_fail(target_ip, 1)[0]
+        timeout = self.timeout
+        if self._is_idempotent([command_text]):
+            timeout = self._timeout_for(health, timeout)
+        writer = None
+        started = time.perf_counter()
+        failed = True
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(target_ip, target_port or self.port_for(target_ip)),
+                timeout)
+
+            writer.write((command_text.strip() + "\n").encode('utf-8'))
+            await writer.drain()
+
+            response = await asyncio.wait_for(reader.readline(), timeout)
             if not response:
                 return "ER Empty response"
-            
+
+            failed = False
             return response.decode('utf-8').strip()
 
-        except socket.timeout:
+        except asyncio.TimeoutError:
             return f"ER Timeout ({target_ip} neodpovídá)"
         except ConnectionRefusedError:
             return f"ER Connection Refused ({target_ip} neběží)"
         except Exception as e:
             return f"ER Network Error: {str(e)}"
         finally:
-            if s:
-                s.close() # Vždy slušně zavřít spojení
+            if writer:
+                writer.close()
+            self._record(target_ip, started, failed)
+            if failed:
+                health.record_failure()
+
+class PeerStats:
+    """Naposledy zjištěný stav jedné banky (záznam v PeerStatsCache)."""
+    def __init__(self, ip):
+        self.ip = ip
+        self.money = 0
+        self.clients = 0
+        self.latency = None    # Doba skenu v sekundách
+        self.last_seen = None  # Kdy banka naposledy odpověděla (monotonic)
+        self.failures = 0      # Počet neúspěchů v řadě
+        self.retry_at = 0.0    # Do kdy banku neskenovat (backoff)
+
+
+class PeerStatsCache:
+    """
+    Cache statistik bank pro RP (klíč = IP).
+    - Úspěšný sken platí ttl sekund.
+    - Nedostupná banka dostane negativní záznam a další pokus až po
+      exponenciálně rostoucí pauze (backoff_base * 2^n, max backoff_max).
+    """
+    def __init__(self, ttl=30.0, backoff_base=5.0, backoff_max=300.0):
+        self.ttl = ttl
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def record_success(self, ip, money, clients, latency):
+        with self._lock:
+            entry = self._entries.setdefault(ip, PeerStats(ip))
+            entry.money = money
+            entry.clients = clients
+            entry.latency = latency
+            entry.last_seen = time.monotonic()
+            entry.failures = 0
+            entry.retry_at = 0.0
+
+    def record_failure(self, ip):
+        with self._lock:
+            entry = self._entries.setdefault(ip, PeerStats(ip))
+            entry.failures += 1
+            delay = min(self.backoff_base * 2 ** (entry.failures - 1), self.backoff_max)
+            entry.retry_at = time.monotonic() + delay
+
+    def fresh(self, ip):
+        """Vrátí platný (ne starší než ttl) úspěšný záznam, jinak None."""
+        entry = self._entries.get(ip)
+        if entry and not entry.failures and entry.last_seen is not None \
+                and time.monotonic() - entry.last_seen <= self.ttl:
+            return entry
+        return None
+
+    def needs_scan(self, ip):
+        """True, pokud záznam chybí nebo je prošlý a banka není v backoffu."""
+        entry = self._entries.get(ip)
+        if entry is None:
+            return True
+        if entry.failures:
+            return time.monotonic() >= entry.retry_at
+        return self.fresh(ip) is None
+
+    def get(self, ip):
+        return self._entries.get(ip)
+
+    def due_for_refresh(self, ip, margin):
+        """Jako needs_scan, ale platný záznam obnoví už margin sekund před vypršením."""
+        entry = self._entries.get(ip)
+        if entry is None or entry.failures or entry.last_seen is None:
+            return self.needs_scan(ip)
+        return time.monotonic() - entry.last_seen >= self.ttl - margin
+
 
 class RobberyPlanner:
     """
     Logika pro úroveň HACKER.
     Skenuje síť a hledá nejlepší cíl pro loupež.
+    Banky se skenují paralelně: celý sken trvá nejvýš scan_deadline sekund,
+    jedna banka nejvýš peer_timeout. Co nestihne termín, se vynechá.
+    Výsledky se drží v PeerStatsCache, kterou na pozadí obnovuje
+    refresher (spustí se při prvním RP), takže RP většinou odpoví z cache.
     """
-    def __init__(self, client):
+    def __init__(self, client, scan_workers=32, scan_deadline=6.0, peer_timeout=3.0,
+                 cache_ttl=30.0, refresh_interval=10.0):
         self.client = client # Instance NetworkClient
         self.peers_file = "peers.txt"
+        self.scan_deadline = scan_deadline
+        self.peer_timeout = peer_timeout
+        self.refresh_interval = refresh_interval
+        self.cache = PeerStatsCache(ttl=cache_ttl)
+        self._executor = ThreadPoolExecutor(max_workers=scan_workers,
+                                            thread_name_prefix="rp-scan")
+        self._refresher = None
+        self._refresher_lock = threading.Lock()
+        self._legacy_peers = set()  # Banky bez pipeliningu (odpoví jen na první příkaz)
 
     def _load_peers(self):
         """
         Načte seznam IP adres spolužáků ze souboru peers.txt.
-        Každá IP na novém řádku.
+        Každá IP na novém řádku, volitelně s portem (IP:PORT).
         """
         peers = []
         try:
             with open(self.peers_file, "r") as f:
                 for line in f:
-                    ip = line.strip()
+                    ip, _, port = line.strip().partition(":")
                     if ip and not ip.startswith("#"):
                         peers.append(ip)
+                        if port.isdigit():
+                            self.client.peer_ports[ip] = int(port)
         except FileNotFoundError:
             # Fallback pro testování, pokud soubor neexistuje
-            print(f"[WARN] {self.peers_file} nenalezen, používám testovací seznam.")
+            log.warning("%s nenalezen, používám testovací seznam.", self.peers_file)
             return ["127.0.0.1"] 
         return peers
 
-    def plan_robbery(self, target_amount, my_ip):
+    def _scan_peer(self, ip):
+        """
+        Zjistí (peníze, klienti) jedné banky a zapíše je do cache.
+        BA a BN jdou jedním spojením. Banka, která odpoví jen na BA (starší
+        implementace bez pipeliningu), dostane BN zvlášť a příště už obojí zvlášť.
+        Při nedostupnosti vrátí None.
+        """
+        started = time.monotonic()
+        if ip in self._legacy_peers:
+            resp_ba = self.client.send_commands(ip, ["BA"], timeout=self.peer_timeout)[0]
+            resp_bn = self.client.send_commands(ip, ["BN"], timeout=self.peer_timeout)[0]
+        else:
+            resp_ba, resp_bn = self.client.send_commands(ip, ["BA", "BN"], timeout=self.peer_timeout)
+            if resp_ba.startswith("BA") and not resp_bn.startswith("BN"):
+                log.info("Banka %s neodpověděla na pipelining, BA/BN posílám zvlášť.", ip)
+                self._legacy_peers.add(ip)
+                resp_bn = self.client.send_commands(ip, ["BN"], timeout=self.peer_timeout)[0]
+        latency = time.monotonic() - started
+
+        if not resp_ba.startswith("BA") and not resp_bn.startswith("BN"):
+            self.cache.record_failure(ip)
+            return None
+
+        # Analýza odpovědí (musí začínat BA/BN a následovat číslo)
+        money = 0
+        clients = 0
+        
+        if resp_ba.startswith("BA"):
+            try: money = int(resp_ba.split()[1])
+            except: money = 0
+        
+        if resp_bn.startswith("BN"):
+            try: clients = int(resp_bn.split()[1])
+            except: clients = 0
+
+        self.cache.record_success(ip, money, clients, latency)
+        return money, clients
+
+    def scan_network(self, my_ip, peers=None):
+        """
+        Paralelně oskenuje banky (výchozí: všechny z peers.txt).
+        Vrací {ip: (peníze, klienti)} jen pro banky, které odpověděly do termínu.
+        """
+        if peers is None:
+            peers = self._load_peers()
+        peers = [ip for ip in peers if ip != my_ip] # Nebudeme vykrádat sami sebe
+        futures = {self._executor.submit(self._scan_peer, ip): ip for ip in peers}
+        if not futures:
+            return {}
+
+        done, not_done = wait(futures, timeout=self.scan_deadline)
+        for future in not_done:
+            future.cancel() # Ještě nezačaté skeny už nemají smysl
+
+        results = {}
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                log.warning("Sken %s selhal: %s", futures[future], e)
+                continue
+            if result is not None:
+                results[futures[future]] = result
+
+        if not_done:
+            late = ", ".join(futures[f] for f in not_done)
+            log.info("Sken: nestihly termín %ss: %s", self.scan_deadline, late)
+        return results
+
+    def _collect_stats(self, my_ip, force_refresh):
+        """
+        Vrátí {ip: (peníze, klienti)}. Z cache bere platné záznamy,
+        skenuje jen banky bez platného záznamu (a mimo backoff).
+        force_refresh oskenuje všechny banky znovu.
+        """
+        peers = [ip for ip in self._load_peers() if ip != my_ip]
+        if force_refresh:
+            return self.scan_network(my_ip, peers)
+
+        stats = {}
+        to_scan = []
+        for ip in peers:
+            entry = self.cache.fresh(ip)
+            if entry:
+                stats[ip] = (entry.money, entry.clients)
+            elif self.cache.needs_scan(ip):
+                to_scan.append(ip)
+
+        stats.update(self.scan_network(my_ip, to_scan))
+        return stats
+
+    def _ensure_refresher(self, my_ip):
+        """Spustí (jednou) vlákno, které drží cache teplou."""
+        with self._refresher_lock:
+            if self._refresher or not self.refresh_interval:
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, args=(my_ip,),
+                                               name="rp-refresher", daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self, my_ip):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                peers = [ip for ip in self._load_peers()
+                         if self.cache.due_for_refresh(ip, self.refresh_interval)]
+                self.scan_network(my_ip, peers)
+            except Exception as e:
+                log.error("Obnova cache selhala: %s", e)
+
+    def plan_robbery(self, target_amount, my_ip, force_refresh=False):
         """
         Hlavní algoritmus loupeže.
-        1. Oskenuje všechny banky (zjistí peníze a klienty).
+        1. Zjistí peníze a klienty všech bank (z cache nebo skenem).
         2. Vybere ty nejlepší, aby součet >= target_amount.
         3. Minimalizuje počet poškozených klientů.
         """
-        peers = self._load_peers()
         candidates = [] # Seznam slovníků: {'ip': str, 'money': int, 'clients': int}
         
-        print(f"[ROBBERY] Začínám skenovat síť. Cíl: {target_amount}")
-
-        # 1. Fáze: Sběr dat (Scan)
-        for ip in peers:
-            if ip == my_ip: continue # Nebudeme vykrádat sami sebe
-
-            # Zjistíme zůstatek (BA)
-            resp_ba = self.client.send_command(ip, "BA")
-            # Zjistíme počet klientů (BN)
-            resp_bn = self.client.send_command(ip, "BN")
-
-            # Analýza odpovědí (musí začínat BA/BN a následovat číslo)
-            money = 0
-            clients = 0
-            
-            if resp_ba.startswith("BA"):
-                try: money = int(resp_ba.split()[1])
-                except: money = 0
-            
-            if resp_bn.startswith("BN"):
-                try: clients = int(resp_bn.split()[1])
-                except: clients = 0
+        log.info("Plánuji loupež. Cíl: %s", target_amount)
+        self._ensure_refresher(my_ip)
 
+        # 1. Fáze: Sběr dat (Cache / Scan)
+        for ip, (money, clients) in self._collect_stats(my_ip, force_refresh).items():
             # Pokud má banka peníze, přidáme ji na seznam kandidátů
             if money > 0:
                 candidates.append({'ip': ip, 'money': money, 'clients': clients})
-                print(f"[SCAN] {ip}: {money} $ / {clients} klientů")
-
-        # 2. Fáze: Výběr obětí (Greedy Algorithm)
-        # Seřadíme banky podle poměru "Peníze na jednoho klienta" sestupně.
-        # Tím získáme "nejvíc muziky za nejmíň poškozených lidí".
-        # (Abychom se vyhnuli dělení nulou, dáme clients+1 nebo 1)
-        candidates.sort(key=lambda x: x['money'] / (x['clients'] if x['clients'] > 0 else 0.1), reverse=True)
+                log.debug("Kandidát %s: %s $ / %s klientů", ip, money, clients)
 
-        current_loot = 0
-        victims_count = 0
-        robbed_ips = []
-
-        for bank in candidates:
-            if current_loot >= target_amount:
-                break
-            
-            robbed_ips.append(bank['ip'])
-            current_loot += bank['money']
-            victims_count += bank['clients']
+        # 2. Fáze: Výběr obětí
+        # Hledáme kombinaci bank se součtem >= cíl a NEJMENŠÍM počtem klientů
+        # (přesný solver místo původního hladového řazení, viz robbery_solver.py).
+        plan = solve(candidates, target_amount)
+        robbed_ips = [bank['ip'] for bank in plan.banks]
+        current_loot = plan.money
+        victims_count = plan.victims
 
         # 3. Fáze: Výsledek
         if current_loot == 0:
@@ -140,5 +771,8 @@ class RobberyPlanner:
         
         msg = (f"RP K dosažení cíle {target_amount} je třeba vyloupit banky: {ips_str}. "
                f"Získáte celkem {current_loot} a bude poškozeno {victims_count} klientů.")
+
+        if not plan.optimal:
+            msg += f" (Nemusí být optimální, odchylka max. {plan.gap:.0%}.)"
         
         return msg
\ No newline at end of file
@@ -1,172 +1,660 @@
-import socket
-import random
-from shared import i18n, ThreadSafeJsonStorage
+import ipaddress
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from shared import discover_local_ip, i18n, metrics
+from storage import open_storage
+
+log = logging.getLogger("bank.logic")
+
+# Typy argumentů příkazů (viz CommandSpec) -> převodní funkce tokenu.
+# Při chybném formátu vyhodí ValueError.
+def _parse_account(token):
+    """CISLO/IP -> (cislo, ip)"""
+    acc_num, sep, ip = token.partition("/")
+    if not sep or not acc_num or not ip or "/" in ip:
+        raise ValueError(token)
+    return (acc_num, ip)
+
+def _parse_amount(token):
+    """Nezáporné celé číslo"""
+    value = int(token)
+    if value < 0:
+        raise ValueError(token)
+    return value
+
+def _is_ip_address(text):
+    """
+    Je text IP adresa (v4 nebo v6)? Ověřuje se až před proxy na cizí banku,
+    z IP se tam stávají klíče stavu banky a štítky metrik.
+    """
+    try:
+        ipaddress.ip_address(text)
+    except ValueError:
+        return False
+    return True
+
+ARG_ACCOUNT = _parse_account
+ARG_AMOUNT = _parse_amount
+ARG_INT = int
+ARG_WORD = str.upper
+
+
+def _compile_parser(converters, required):
+    """
+    Předkompiluje parser argumentů pro danou aritu příkazu.
+    Text se projde jednou (split s limitem = jen potřebné tokeny)
+    a výsledek je rovnou tuple převedených hodnot.
+    Parser vrací None při chybném formátu; přebytečné argumenty ignoruje.
+    Příkaz bez argumentů parser nemá (vrací se None, volající použije ()).
+    """
+    count = len(converters)
+    if count == 0:
+        return None
+
+    if converters[0] is ARG_ACCOUNT and required == count <= 2:
+        return _compile_account_parser(converters[1:])
+
+    if count == 1:
+        (first,) = converters
+        def parse(rest):
+            tokens = rest.split(None, 1)
+            if not tokens:
+                return () if required == 0 else None
+            try:
+                return (first(tokens[0]),)
+            except ValueError:
+                return None
+        return parse
+
+    if count == 2:
+        first, second = converters
+        def parse(rest):
+            tokens = rest.split(None, 2)
+            try:
+                if len(tokens) >= 2:
+                    return (first(tokens[0]), second(tokens[1]))
+                if len(tokens) < required:
+                    return None
+                return (first(tokens[0]),) if tokens else ()
+            except ValueError:
+                return None
+        return parse
+
+    def parse(rest):
+        tokens = rest.split(None, count)
+        if len(tokens) < required:
+            return None
+        try:
+            return tuple(convert(token) for convert, token in zip(converters, tokens))
+        except ValueError:
+            return None
+    return parse
+
+
+def _compile_account_parser(more):
+    """
+    Parser pro nejčastější tvar "CISLO/IP [CASTKA]" (AB/AR, AD/AW).
+    Kontrola účtu je vložená přímo (stejná pravidla jako _parse_account),
+    takže rychlá cesta process_command volá jen parser a handler.
+    """
+    if not more:
+        def parse(rest):
+            tokens = rest.split(None, 1)
+            if not tokens:
+                return None
+            acc_num, sep, ip = tokens[0].partition("/")
+            if not sep or not acc_num or not ip or "/" in ip:
+                return None
+            return ((acc_num, ip),)
+        return parse
+
+    (second,) = more
+    def parse(rest):
+        tokens = rest.split(None, 2)
+        if len(tokens) < 2:
+            return None
+        acc_num, sep, ip = tokens[0].partition("/")
+        if not sep or not acc_num or not ip or "/" in ip:
+            return None
+        try:
+            return ((acc_num, ip), second(tokens[1]))
+        except ValueError:
+            return None
+    return parse
+
+
+class CommandSpec:
+    """
+    Záznam v tabulce příkazů: kód, handler a deklarované argumenty.
+    Handler se volá jako handler(raw_command, args), kde args je tuple
+    už převedených argumentů (viz parse_args).
+    Latence se měří u každého latency_sample-tého volání (histogram ho
+    započítá s touto vahou), chybové odpovědi se počítají všechny.
+    """
+    __slots__ = ("code", "handler", "arg_types", "required", "proxyable", "parse_args",
+                 "latency_sample", "sampler", "latency", "errors")
+
+    def __init__(self, code, handler, arg_types=(), optional=0, proxyable=False, latency_sample=1):
+        self.code = code
+        self.handler = handler
+        self.arg_types = tuple(arg_types)
+        self.required = len(self.arg_types) - optional
+        self.proxyable = proxyable  # Příkaz s CISLO/IP, který může jít na cizí banku
+        self.parse_args = _compile_parser(self.arg_types, self.required)
+        self.latency_sample = latency_sample
+        # True u každého latency_sample-tého volání (next() na cycle je atomické i mezi vlákny)
+        self.sampler = itertools.cycle([True] + [False] * (latency_sample - 1))
+        # Metriky se dohledají jednou při registraci, ne při každém volání
+        self.latency = metrics.histogram("bank_command_seconds", "Doba zpracování příkazu", cmd=code)
+        self.errors = metrics.counter("bank_command_errors_total", "Příkazy s odpovědí ER", cmd=code)
+
+
+class _BatchAborted(Exception):
+    """Zruší transakci dávky AX (žádná lokální změna se nezapíše)."""
+
+
+class StorageNotReady(Exception):
+    """Úložiště se ještě načítá na pozadí (viz BankController, background_load)."""
+
+
+class ProxyBalanceCache:
+    """
+    LRU cache odpovědí AB z cizích bank (klíč = "CISLO/IP").
+    - Záznam platí ttl sekund, nejvýš max_size záznamů (nejdéle nepoužitý vypadne).
+    - invalidate() zahodí záznam a zvýší epochu; odpověď, jejíž dotaz začal
+      před invalidací, se pak už neuloží (jinak by se mohl vrátit starý zůstatek).
+    """
+    def __init__(self, ttl=1.0, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.epoch = 0
+        self._entries = OrderedDict()  # klíč -> (odpověď, čas uložení)
+        self._lock = threading.Lock()
+        self._hits = metrics.counter("bank_proxy_cache_hits_total", "AB z cache proxy")
+        self._misses = metrics.counter("bank_proxy_cache_misses_total", "AB bez platného záznamu v cache")
+        metrics.gauge("bank_proxy_cache_entries", "Záznamy v cache proxy AB",
+                      func=lambda: len(self._entries))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self._hits.inc()
+                return entry[0]
+            if entry:
+                del self._entries[key]
+            self._misses.inc()
+            return None
+
+    def put(self, key, response, epoch):
+        """Uloží odpověď, pokud od začátku dotazu (epoch) nebyla žádná invalidace."""
+        with self._lock:
+            if epoch != self.epoch:
+                return
+            self._entries[key] = (response, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self.epoch += 1
+            self._entries.pop(key, None)
 
-try:
-    from hacker import NetworkClient, RobberyPlanner
-except ImportError:
-    NetworkClient = None
-    RobberyPlanner = None
 
 class BankController:
     """
     Hlavní logika banky.
     Rozhoduje, zda příkaz vykonat lokálně, nebo ho poslat dál (Proxy).
+    Příkazy se hledají v tabulce {kód: CommandSpec} (viz register_command).
+
+    Rychlý start:
+    - my_ip přepíše zjišťování IP z rozhraní (viz shared.discover_local_ip),
+    - background_load=True načítá úložiště na pozadí; příkazy, které ho
+      potřebují, mezitím čekají nejvýš ready_timeout s (pak "ER" - načítá se),
+    - proxy a RP (modul hacker) se načtou až při prvním použití.
+
+    proxy_cache_ttl > 0 zapne cache odpovědí AB z cizích bank (ProxyBalanceCache);
+    proxované AD/AW/AR na stejný účet záznam zneplatní.
     """
-    def __init__(self, storage_file='data.json'):
-        self.storage = ThreadSafeJsonStorage(storage_file)
-        self.my_ip = self._get_local_ip()
-        
-        self.net_client = NetworkClient() if NetworkClient else None
-        self.robber = RobberyPlanner(self.net_client) if RobberyPlanner else None
+    PROXY_WRITES = ("AD", "AW", "AR")
+    # Latence běžných příkazů se měří u každého 16. volání (dvě volání perf_counter
+    # a zápis do histogramu by stály víc než celé parsování a dispatch)
+    LATENCY_SAMPLE = 16
 
-    def _get_local_ip(self):
-        """Zjistí skutečnou IP adresu tohoto stroje v síti."""
+    def __init__(self, storage_file='data.json', shards=0, engine="ledger",
+                 my_ip=None, background_load=False, ready_timeout=5.0, durability="strict",
+                 proxy_cache_ttl=0.0, proxy_cache_size=10000):
+        self.started_at = time.perf_counter()
+        self.my_ip = discover_local_ip(my_ip)
+        self.ready_timeout = ready_timeout
+        self.load_time = None  # Doba načtení úložiště (s)
+
+        self._storage = None
+        self._storage_error = None
+        self._ready = threading.Event()
+        # Engine úložiště, počet shard a durability viz storage.open_storage
+        storage_args = (storage_file, engine, shards, durability)
+        if background_load:
+            threading.Thread(target=self._load_storage, args=storage_args,
+                             name="storage-load", daemon=True).start()
+        else:
+            self._storage = open_storage(*storage_args)
+            self.load_time = time.perf_counter() - self.started_at
+            self._ready.set()
+
+        self._net_client = None
+        self._robber = None
+        self.proxy_cache = None
+        if proxy_cache_ttl > 0 and proxy_cache_size > 0:
+            self.proxy_cache = ProxyBalanceCache(proxy_cache_ttl, proxy_cache_size)
+        self._hacker_loaded = False
+        self._hacker_lock = threading.Lock()
+
+        self._commands = {}
+        self._unknown_commands = metrics.counter("bank_unknown_commands_total", "Neznámé příkazy")
+        self._register_builtin_commands()
+
+    # --- LÍNĚ NAČÍTANÉ ČÁSTI ---
+
+    def _load_storage(self, *storage_args):
+        started = time.perf_counter()
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except Exception:
-            return "127.0.0.1"
+            self._storage = open_storage(*storage_args)
+            self.load_time = time.perf_counter() - started
+            log.info("Úložiště načteno za %.0f ms.", self.load_time * 1000)
+        except Exception as e:
+            log.critical("Nepodařilo se načíst úložiště: %s", e)
+            self._storage_error = e
+        finally:
+            self._ready.set()
 
-    def process_command(self, raw_command):
+    def wait_ready(self, timeout=None):
+        """Počká na načtení úložiště; vrátí True, pokud je připravené."""
+        return self._ready.wait(timeout) and self._storage is not None
+
+    @property
+    def storage(self):
+        storage = self._storage
+        if storage is None:
+            if not self._ready.wait(self.ready_timeout):
+                raise StorageNotReady()
+            if self._storage_error:
+                raise RuntimeError(f"Úložiště není k dispozici: {self._storage_error}")
+            storage = self._storage
+        return storage
+
+    def close(self):
+        """Při ukončení: zavře spojení proxy a uloží a zavře úložiště (pokud je načtené)."""
+        if self._net_client:
+            self._net_client.close()
+        if self._storage is not None:
+            self._storage.close()
+
+    def _load_hacker(self):
+        """Načte modul hacker (proxy klient + RP) při prvním použití."""
+        with self._hacker_lock:
+            if self._hacker_loaded:
+                return
+            try:
+                from hacker import NetworkClient, RobberyPlanner
+            except ImportError as e:
+                log.warning("Modul hacker není k dispozici (%s), proxy a RP nefungují.", e)
+            else:
+                self._net_client = NetworkClient()
+                self._robber = RobberyPlanner(self._net_client)
+            self._hacker_loaded = True
+
+    @property
+    def net_client(self):
+        if not self._hacker_loaded:
+            self._load_hacker()
+        return self._net_client
+
+    @net_client.setter
+    def net_client(self, client):
+        self._load_hacker()
+        self._net_client = client
+
+    @property
+    def robber(self):
+        if not self._hacker_loaded:
+            self._load_hacker()
+        return self._robber
+
+    @robber.setter
+    def robber(self, planner):
+        self._load_hacker()
+        self._robber = planner
+
+    # --- TABULKA PŘÍKAZŮ ---
+
+    def register_command(self, code, handler, arg_types=(), optional=0, proxyable=False,
+                         latency_sample=None):
         """
-        Vstupní bod. Vezme text příkazu a vrátí textovou odpověď.
+        Přidá (nebo nahradí) příkaz protokolu.
+        Nový příkaz stačí zaregistrovat, process_command se nemění.
+        latency_sample = měřit latenci každého n-tého volání (výchozí LATENCY_SAMPLE,
+        1 = každé volání - pro vzácné a drahé příkazy).
+        """
+        self._commands[code.upper()] = CommandSpec(code.upper(), handler, arg_types,
+                                                   optional, proxyable,
+                                                   latency_sample or self.LATENCY_SAMPLE)
+
+    def _register_builtin_commands(self):
+        # BC - Bank Code (Vrací vždy mou IP)
+        self.register_command("BC", self._cmd_bc)
+        # BN - Bank Number (Počet klientů - Lokální)
+        self.register_command("BN", self._cmd_bn)
+        # BA - Bank Amount (Celková suma - Lokální)
+        self.register_command("BA", self._cmd_ba)
+        # AC - Account Create (Vytvoření účtu - Lokální)
+        self.register_command("AC", self._cmd_ac)
+        # RP - Robbery Plan (HACKER FEATURE), "RP <castka> FRESH" vynutí nový sken
+        self.register_command("RP", self._cmd_rp, (ARG_INT, ARG_WORD), optional=2, latency_sample=1)
+
+        # Příkazy s číslem účtu - formát: KOD CISLO/IP [CASTKA]
+        self._account_ops = {"AD": self._op_ad, "AW": self._op_aw,
+                             "AB": self._op_ab, "AR": self._op_ar}
+        self.register_command("AD", self._routed(self._op_ad), (ARG_ACCOUNT, ARG_AMOUNT), proxyable=True)
+        self.register_command("AW", self._routed(self._op_aw), (ARG_ACCOUNT, ARG_AMOUNT), proxyable=True)
+        self.register_command("AB", self._routed(self._op_ab), (ARG_ACCOUNT,), proxyable=True)
+        self.register_command("AR", self._routed(self._op_ar), (ARG_ACCOUNT,), proxyable=True)
+
+        # AX - dávka účtových příkazů oddělených '|' (argumenty si parsuje sám)
+        self.register_command("AX", self._cmd_ax, latency_sample=1)
+
+        # MT - Metrics (administrace): jednořádkový souhrn metrik uzlu
+        self.register_command("MT", self._cmd_mt, latency_sample=1)
+
+    def _lookup(self, raw_command):
+        """
+        Vrátí (CommandSpec nebo None, zbytek příkazu za kódem).
+        Rychlá cesta = kód velkými písmeny a mezera; jinak (malá písmena,
+        tabulátor či jiný bílý znak za kódem) se dělí pomaleji přes split().
         """
-        if not raw_command:
-            return ""
+        code, _, rest = raw_command.partition(" ")
+        spec = self._commands.get(code)
+        if spec is None:
+            parts = raw_command.split(None, 1)
+            if not parts:
+                return None, ""
+            spec = self._commands.get(parts[0].upper())
+            rest = parts[1] if len(parts) > 1 else ""
+        return spec, rest
 
-        parts = raw_command.strip().split()
-        if not parts:
-            return ""
+    def _parse(self, raw_command):
+        """Vrátí (CommandSpec, argumenty), (CommandSpec, None) při chybném formátu, nebo (None, None)."""
+        spec, rest = self._lookup(raw_command)
+        if spec is None:
+            return None, None
+        return spec, spec.parse_args(rest) if spec.parse_args else ()
 
-        cmd_code = parts[0].upper()
+    def process_command(self, raw_command):
+        """
+        Vstupní bod. Vezme text příkazu a vrátí textovou odpověď.
+        Rychlá cesta (kód velkými písmeny a mezera, jak příkazy posílají klienti)
+        stojí jedno partition a jedno hledání v tabulce; okolní bílé znaky,
+        tabulátory a malá písmena řeší jeden split() (jako v _lookup, vloženo
+        sem, protože volání metody by stálo víc než celé hledání).
+        """
+        code, _, rest = raw_command.partition(" ")
+        spec = self._commands.get(code)
+        if spec is None:
+            parts = raw_command.split(None, 1)
+            if not parts:
+                return ""
+            spec = self._commands.get(parts[0].upper())
+            if spec is None:
+                self._unknown_commands.inc()
+                return i18n.get("ERR_UNKNOWN_CMD")
+            raw_command = raw_command.strip()
+            rest = parts[1] if len(parts) > 1 else ""
 
+        timed = next(spec.sampler)  # Latence jen u každého latency_sample-tého volání
+        if timed:
+            started = time.perf_counter()
         try:
-            # --- 1. ROUTING PŘÍKAZŮ ---
-            
-            # BC - Bank Code (Vrací vždy mou IP)
-            if cmd_code == "BC":
-                return f"BC {self.my_ip}"
-
-            # BN - Bank Number (Počet klientů - Lokální)
-            if cmd_code == "BN":
-                return self._local_bn()
-
-            # BA - Bank Amount (Celková suma - Lokální)
-            if cmd_code == "BA":
-                return self._local_ba()
-            
-            # AC - Account Create (Vytvoření účtu - Lokální)
-            if cmd_code == "AC":
-                return self._local_ac()
-
-            # RP - Robbery Plan (HACKER FEATURE)
-            if cmd_code == "RP":
-                if self.robber:
-                    target_amount = int(parts[1]) if len(parts) > 1 else 0
-                    return self.robber.plan_robbery(target_amount, self.my_ip)
-                else:
-                    return i18n.get("ERR_UNKNOWN_CMD")
-
-            # --- 2. PŘÍKAZY S ČÍSLEM ÚČTU (AD, AW, AB, AR) ---            
-            if cmd_code in ["AD", "AW", "AB", "AR"]:
-                if len(parts) < 2:
-                    return f"{i18n.get('ERR_INVALID_FORMAT')}"
-                
-                # Formát: KOD CISLO/IP [CASTKA]
-                account_full = parts[1] # např. 10001/10.1.2.3
-                
-                if '/' not in account_full:
-                    return f"{i18n.get('ERR_INVALID_FORMAT')}"
-
-                acc_num_str, target_ip = account_full.split('/')
-
-                # -- ROZHODNUTÍ: LOKÁLNĚ NEBO PROXY? --
-                if target_ip == self.my_ip or target_ip in ["127.0.0.1", "localhost"]:
-                    return self._handle_local_account_cmd(cmd_code, acc_num_str, parts)
+            if spec.parse_args is None:
+                response = spec.handler(raw_command, ())
+            else:
+                args = spec.parse_args(rest)
+                if args is None:
+                    response = i18n.get("ERR_INVALID_FORMAT")
                 else:
-                    if self.net_client:
-                        print(f"[LOG] Proxying command {cmd_code} to {target_ip}")
-                        return self.net_client.send_command(target_ip, raw_command)
-                    else:
-                        return i18n.get("ERR_INTERNAL") 
-            return i18n.get("ERR_UNKNOWN_CMD")
+                    response = spec.handler(raw_command, args)
 
+        except StorageNotReady:
+            response = i18n.get("ERR_STARTING")
         except Exception as e:
-            print(f"[ERROR] Logic error: {e}")
-            return f"{i18n.get('ERR_INTERNAL')} ({str(e)})"
+            log.exception("Chyba při zpracování příkazu: %s", e)
+            response = f"{i18n.get('ERR_INTERNAL')} ({str(e)})"
 
-    def _handle_local_account_cmd(self, cmd, acc_num, parts):
-        """Zpracování AD, AW, AB, AR pro MOJI banku."""
-        data = self.storage.load()
-        
-        # Validace existence účtu (kromě AC, ale ten je řešen zvlášť)
-        if acc_num not in data:
-            return i18n.get("ERR_ACCOUNT_NOT_FOUND")
+        if timed:
+            spec.latency.observe(time.perf_counter() - started, spec.latency_sample)
+        if "E" <= response < "F":  # Na "E" začíná jen chybová odpověď "ER ..." (levnější než startswith)
+            spec.errors.inc()
+        return response
 
-        # AD - Deposit
-        if cmd == "AD":
-            if len(parts) < 3: return i18n.get("ERR_INVALID_FORMAT")
-            try:
-                amount = int(parts[2])
-            except ValueError: return i18n.get("ERR_INVALID_FORMAT")
-            
-            if amount < 0: return i18n.get("ERR_INVALID_FORMAT")
-            
-            data[acc_num] += amount
-            self.storage.save(data)
-            return "AD"
-
-        # AW - Withdrawal
-        if cmd == "AW":
-            if len(parts) < 3: return i18n.get("ERR_INVALID_FORMAT")
+    def record_command(self, raw_command, started, response):
+        """Metriky příkazu vyřízeného mimo process_command (asynchronní proxy v AsyncBankServer)."""
+        spec, _ = self._lookup(raw_command.strip())
+        if spec is None:
+            return
+        spec.latency.observe(time.perf_counter() - started)
+        if "E" <= response < "F":
+            spec.errors.inc()
+
+    def _is_local_ip(self, ip):
+        return ip == self.my_ip or ip in ("127.0.0.1", "localhost")
+
+    def proxy_target(self, raw_command):
+        """
+        Vrátí IP cizí banky, pokud se má příkaz přeposlat (Proxy), jinak None.
+        Umožňuje síťové vrstvě přeposlat příkaz sama (např. neblokujícím socketem).
+        """
+        spec, args = self._parse(raw_command.strip())
+        if spec is None or not spec.proxyable or not args:
+            return None
+        target_ip = args[0][1]
+        if self._is_local_ip(target_ip) or not _is_ip_address(target_ip):
+            return None  # Neplatnou IP odmítne process_command
+        return target_ip
+
+    def begin_proxy(self, raw_command):
+        """
+        Volá se před přeposláním příkazu na cizí banku.
+        Vrací (odpověď z cache nebo None, ticket pro end_proxy).
+        Proxované AD/AW/AR zneplatní záznam účtu v cache.
+        """
+        if self.proxy_cache is None:
+            return None, None
+        parts = raw_command.split(None, 1)
+        code = parts[0].upper() if parts else ""
+        rest = parts[1] if len(parts) > 1 else ""
+        if code != "AB" and code not in self.PROXY_WRITES:
+            return None, None
+        key = rest.split(None, 1)[0] if rest.strip() else None
+        if key is None:
+            return None, None
+        if code == "AB":
+            cached = self.proxy_cache.get(key)
+            if cached is not None:
+                return cached, None
+            return None, (code, key, self.proxy_cache.epoch)
+        self.proxy_cache.invalidate(key)
+        return None, (code, key, None)
+
+    def end_proxy(self, ticket, response):
+        """Zpracuje odpověď cizí banky: úspěšné AB uloží, po zápisu znovu zneplatní."""
+        if ticket is None:
+            return
+        code, key, epoch = ticket
+        if code == "AB":
+            if response.startswith("AB"):
+                self.proxy_cache.put(key, response, epoch)
+        else:
+            # I dotaz, který začal během zápisu, musí jít znovu na banku
+            self.proxy_cache.invalidate(key)
+
+    def _send_proxy(self, target_ip, raw_command):
+        cached, ticket = self.begin_proxy(raw_command)
+        if cached is not None:
+            return cached
+        response = self.net_client.send_command(target_ip, raw_command)
+        self.end_proxy(ticket, response)
+        return response
+
+    def _routed(self, account_op):
+        """
+        Z operace nad účtem udělá handler příkazu s rozhodnutím:
+        LOKÁLNĚ (moje IP, v transakci nad účtem) nebo PROXY (cizí banka).
+        """
+        def handler(raw_command, args):
+            acc_num, target_ip = args[0]
+            if self._is_local_ip(target_ip):
+                with self.storage.account(acc_num) as acct:
+                    return account_op(acct, *args[1:])
+            if not _is_ip_address(target_ip):
+                return i18n.get("ERR_INVALID_FORMAT")
+            if self.net_client:
+                log.debug("Proxy %s -> %s", raw_command, target_ip)
+                return self._send_proxy(target_ip, raw_command)
+            return i18n.get("ERR_INTERNAL")
+        return handler
+
+    def _cmd_rp(self, raw_command, args):
+        if not self.robber:
+            return i18n.get("ERR_UNKNOWN_CMD")
+        target_amount = args[0] if args else 0
+        force_refresh = len(args) > 1 and args[1] == "FRESH"
+        return self.robber.plan_robbery(target_amount, self.my_ip, force_refresh)
+
+    def _cmd_ax(self, raw_command, args):
+        """
+        AX - dávka: "AX AD 10001/IP 500|AW 10002/IP 200|AB 10001/IP".
+        Lokální operace se ověří a provedou atomicky (vše, nebo nic) a zapíšou
+        jedním zápisem. Operace pro cizí banky se po úspěšném lokálním commitu
+        pošlou po skupinách - každé bance jedním spojením (pipelining).
+        Odpověď: "AX vysledek1|vysledek2|..." ve stejném pořadí.
+        """
+        ops = []
+        for op_text in self._lookup(raw_command)[1].split("|"):
+            op_text = op_text.strip()
+            spec, op_args = self._parse(op_text)
+            if spec is None or op_args is None or spec.code not in self._account_ops:
+                return i18n.get("ERR_INVALID_FORMAT")
+            ops.append((spec.code, op_text, op_args))
+
+        results = [None] * len(ops)
+        local = []
+        remote = {}  # ip -> [(index, text operace)]
+        for index, (code, op_text, op_args) in enumerate(ops):
+            target_ip = op_args[0][1]
+            if self._is_local_ip(target_ip):
+                local.append(index)
+            elif not _is_ip_address(target_ip):
+                return i18n.get("ERR_INVALID_FORMAT")
+            else:
+                remote.setdefault(target_ip, []).append((index, op_text))
+
+        # 1. Lokální část - jedna transakce nad všemi dotčenými účty
+        if local:
             try:
-                amount = int(parts[2])
-            except ValueError: return i18n.get("ERR_INVALID_FORMAT")
-
-            if data[acc_num] < amount:
-                return i18n.get("ERR_LOW_FUNDS")
-            
-            data[acc_num] -= amount
-            self.storage.save(data)
-            return "AW"
-
-        # AB - Balance
-        if cmd == "AB":
-            balance = data[acc_num]
-            return f"AB {balance}"
-
-        # AR - Remove
-        if cmd == "AR":
-            if data[acc_num] > 0:
-                return i18n.get("ERR_ACCOUNT_NOT_EMPTY")
-            
-            del data[acc_num]
-            self.storage.save(data)
-            return "AR"
-
-    def _local_ac(self):
-        """Vytvoří nový účet u nás."""
-        data = self.storage.load()
-        
-        new_acc = str(random.randint(10000, 99999))
-        while new_acc in data:
-            new_acc = str(random.randint(10000, 99999))
-        
-        # Založení s nulou
-        data[new_acc] = 0
-        self.storage.save(data)
+                with self.storage.accounts({ops[i][2][0][0] for i in local}) as accts:
+                    for index in local:
+                        code, _, op_args = ops[index]
+                        result = self._account_ops[code](accts[op_args[0][0]], *op_args[1:])
+                        results[index] = result
+                        if result.startswith("ER"):
+                            raise _BatchAborted()
+            except _BatchAborted:
+                aborted = i18n.get("ERR_BATCH_ABORTED")
+                return "AX " + "|".join(result if result and result.startswith("ER") else aborted
+                                        for result in results)
+
+        # 2. Cizí banky - všechny operace pro jednu banku jedním spojením
+        #    (zápisy zneplatní cache AB; AB z dávky se do cache neukládá)
+        for target_ip, items in remote.items():
+            tickets = [self.begin_proxy(op_text)[1] for index, op_text in items
+                       if ops[index][0] in self.PROXY_WRITES]
+            if self.net_client:
+                responses = self.net_client.send_commands(target_ip, [op_text for _, op_text in items])
+            else:
+                responses = [i18n.get("ERR_INTERNAL")] * len(items)
+            for ticket in tickets:
+                self.end_proxy(ticket, "")
+            for (index, _), response in zip(items, responses):
+                results[index] = response
+
+        return "AX " + "|".join(results)
+
+    # --- OPERACE NAD ÚČTEM (volají se uvnitř transakce) ---
+
+    def _op_ad(self, acct, amount):
+        """AD - Deposit"""
+        if not acct.exists:
+            return i18n.get("ERR_ACCOUNT_NOT_FOUND")
+        acct.balance += amount
+        return "AD"
+
+    def _op_aw(self, acct, amount):
+        """AW - Withdrawal"""
+        if not acct.exists:
+            return i18n.get("ERR_ACCOUNT_NOT_FOUND")
+        if acct.balance < amount:
+            return i18n.get("ERR_LOW_FUNDS")
+        acct.balance -= amount
+        return "AW"
+
+    def _op_ab(self, acct):
+        """AB - Balance"""
+        if not acct.exists:
+            return i18n.get("ERR_ACCOUNT_NOT_FOUND")
+        return f"AB {acct.balance}"
+
+    def _op_ar(self, acct):
+        """AR - Remove"""
+        if not acct.exists:
+            return i18n.get("ERR_ACCOUNT_NOT_FOUND")
+        if acct.balance > 0:
+            return i18n.get("ERR_ACCOUNT_NOT_EMPTY")
+        acct.delete()
+        return "AR"
+
+    # --- LOKÁLNÍ PŘÍKAZY BANKY ---
+
+    def _cmd_bc(self, raw_command, args):
+        """BC - Bank Code"""
+        return f"BC {self.my_ip}"
+
+    def _cmd_mt(self, raw_command, args):
+        """MT - jednořádkový souhrn metrik uzlu"""
+        return f"MT {metrics.summary()}"
+
+    def _cmd_ac(self, raw_command, args):
+        """Vytvoří nový účet u nás (číslo přidělí úložiště, viz AccountAllocator)."""
+        while True:
+            new_acc = self.storage.allocate_account_number()
+            if new_acc is None:
+                return i18n.get("ERR_NO_ACCOUNT_NUMBERS")
+            with self.storage.account(new_acc) as acct:
+                if acct.exists:
+                    continue  # Účet vznikl mimo alokátor -> další číslo
+                # Založení s nulou
+                acct.create(0)
+                break
         
         return f"AC {new_acc}/{self.my_ip}"
 
-    def _local_bn(self):
-        data = self.storage.load()
-        return f"BN {len(data)}"
+    def _cmd_bn(self, raw_command, args):
+        _, count = self.storage.totals()
+        return f"BN {count}"
 
-    def _local_ba(self):
-        data = self.storage.load()
-        total = sum(data.values())
+    def _cmd_ba(self, raw_command, args):
+        total, _ = self.storage.totals()
         return f"BA {total}"
\ No newline at end of file
@@ -1,9 +1,18 @@
+import time
+STARTED_AT = time.perf_counter()  # Pro měření time-to-ready (včetně importů)
+
+import argparse
+import logging
+import os
 import sys
 import signal
-import time
-from shared import i18n
+import threading
+from shared import i18n, metrics, setup_logging
 from logic import BankController
-from network import BankServer
+from network import BankServer, AsyncBankServer
+from storage import ENGINES, LedgerStorage
+
+log = logging.getLogger("bank.main")
 
 # --- KONFIGURACE ---
 # Port musí být v rozsahu 65525 - 65535
@@ -11,6 +20,58 @@ DEFAULT_PORT = 65525
 HOST = "0.0.0.0" 
 TIMEOUT = 60.0
 
+# Režim serveru: None = vlákno na každé spojení, číslo = pevný pool workerů
+WORKERS = None
+MAX_CONNECTIONS = 256  # Aktivní + čekající spojení, nad limit odpověď "ER busy"
+BACKLOG = 128          # Fronta nepřijatých spojení v jádře OS
+
+# Ochrana před agresivními klienty: max. příkazů za sekundu z jedné IP
+# (nárazově RATE_BURST), nad limit okamžité "ER"; None = bez limitu.
+# FAIR_SLOTS = max. souběžně prováděných příkazů, při zahlcení se klienti
+# střídají po IP (jen engine "thread"); slot drží i příkaz čekající na proxy
+# nebo fsync, proto s rezervou. None = bez plánovače
+RATE_LIMIT = 500
+RATE_BURST = 1000
+FAIR_SLOTS = 32
+
+# Logování: úroveň (DEBUG ukáže i jednotlivé zprávy RECV/SENT),
+# vzorkování zpráv (1 = každá, 100 = každá stá) a volitelný JSON-lines soubor
+LOG_LEVEL = "INFO"
+TRAFFIC_SAMPLE_RATE = 10
+LOG_FILE = None  # např. "bank.log.jsonl" (rotuje po 10 MB)
+
+# Metriky: příkaz MT vrací souhrn vždy; METRICS_FILE navíc pravidelně
+# zapisuje metriky ve formátu Prometheus (např. pro node_exporter textfile)
+METRICS_FILE = None  # např. "bank_metrics.prom"
+
+# Úložiště: "ledger" (data.json + write-ahead log; soubor *.bin = binární
+# snapshot) nebo "sqlite" (data.db). Převod stávajících dat: python migrate.py
+STORAGE_ENGINE = "ledger"
+STORAGE_FILES = {"ledger": "data.json", "sqlite": "data.db"}
+# Jen pro "ledger": 0 = jeden proces (LedgerStorage), N > 1 = účty rozdělené
+# mezi N procesů (ShardedStorage, soubory data.json.shard-I-of-N). Při změně
+# počtu se data při startu přerozdělí, původní soubory zůstanou jako *.retired-<čas>
+STORAGE_SHARDS = 0
+# Trvanlivost zápisů: "strict" = fsync na každý commit, "group" = jeden fsync
+# pro dávku souběžných commitů (odpověď až po fsync), "relaxed" = odpověď
+# hned, fsync do 2 ms (pád OS může vzít poslední milisekundy zápisů)
+DURABILITY = "group"
+
+# Cache odpovědí AB z cizích bank (proxy): platnost v sekundách (0 = vypnuto)
+# a max. počet účtů; proxované AD/AW/AR záznam účtu hned zneplatní.
+# Výchozí je vypnutá: AB může vrátit až TTL sekund starý zůstatek (změny
+# provedené jinou cestou než přes tuto banku cache nevidí). Zapnutí např.
+# --proxy-cache-ttl 1 nebo BANK_PROXY_CACHE_TTL=1.
+PROXY_CACHE_TTL = 0
+PROXY_CACHE_SIZE = 10000
+
+# Síťový engine: "thread" (BankServer) nebo "async" (AsyncBankServer)
+DEFAULT_ENGINE = "thread"
+
+# Vše výše jde přepsat z příkazové řádky nebo proměnnými prostředí
+# (python main.py --help). S --non-interactive / BANK_NON_INTERACTIVE=1
+# se nic neptá a chybějící hodnoty se berou z této konfigurace.
+
 def signal_handler(sig, frame):
     """
     Tato funkce se zavolá, když stiskneš Ctrl+C.
@@ -19,17 +80,64 @@ def signal_handler(sig, frame):
     print("\n[SYSTEM] Ukončování aplikace...")
     sys.exit(0)
 
-def main():
+def parse_args(argv=None):
+    """Přepínače příkazové řádky; výchozí hodnoty z proměnných prostředí BANK_*."""
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description="P2P bankovní uzel")
+    parser.add_argument("--lang", default=env("BANK_LANG"), help="jazyk odpovědí (cs / en / fr)")
+    parser.add_argument("--port", type=int, default=env("BANK_PORT"), help=f"port [{DEFAULT_PORT}]")
+    parser.add_argument("--engine", default=env("BANK_ENGINE"), help="síťový engine (thread / async)")
+    parser.add_argument("--host", default=env("BANK_HOST", HOST), help="adresa pro naslouchání")
+    parser.add_argument("--ip", default=env("BANK_IP"),
+                        help="IP adresa této banky (jinak se zjistí z lokálních rozhraní)")
+    parser.add_argument("--storage-engine", default=env("BANK_STORAGE_ENGINE", STORAGE_ENGINE),
+                        choices=ENGINES, help="úložiště (ledger / sqlite)")
+    parser.add_argument("--data", default=env("BANK_DATA"), help="soubor s daty (výchozí podle úložiště)")
+    parser.add_argument("--shards", type=int, default=env("BANK_SHARDS", STORAGE_SHARDS),
+                        help="počet procesů úložiště ledger")
+    parser.add_argument("--durability", default=env("BANK_DURABILITY", DURABILITY),
+                        choices=LedgerStorage.DURABILITY_MODES,
+                        help="trvanlivost zápisů (strict / group / relaxed)")
+    parser.add_argument("--proxy-cache-ttl", type=float,
+                        default=env("BANK_PROXY_CACHE_TTL", PROXY_CACHE_TTL),
+                        help="platnost cache AB z cizích bank v sekundách (0 = vypnuto)")
+    parser.add_argument("--log-level", default=env("BANK_LOG_LEVEL", LOG_LEVEL))
+    parser.add_argument("-y", "--non-interactive", action="store_true",
+                        default=env("BANK_NON_INTERACTIVE", "") not in ("", "0"),
+                        help="neptat se na nic (chybějící hodnoty = výchozí konfigurace)")
+    args = parser.parse_args(argv)
+    if args.storage_engine not in ENGINES:
+        parser.error(f"neznámé úložiště {args.storage_engine!r} (BANK_STORAGE_ENGINE)")
+    if args.durability not in LedgerStorage.DURABILITY_MODES:
+        parser.error(f"neznámý režim durability {args.durability!r} (BANK_DURABILITY)")
+    return args
+
+def report_ready(server, controller, started_at):
+    """Zaloguje, za jak dlouho server naslouchá a kdy je načtené úložiště (time-to-ready)."""
+    server.listening.wait()
+    log.info("Naslouchá po %.0f ms.", (time.perf_counter() - started_at) * 1000)
+    if controller.wait_ready():
+        ready = time.perf_counter() - started_at
+        metrics.gauge("bank_startup_seconds", "Doba od spuštění po připravenost").set(ready)
+        log.info("Připraveno po %.0f ms (načtení úložiště %.0f ms).",
+                 ready * 1000, controller.load_time * 1000)
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging(args.log_level, json_file=LOG_FILE, traffic_sample_rate=TRAFFIC_SAMPLE_RATE)
+    # Dotazy jen na to, co nepřišlo z řádky / prostředí, a jen na terminálu
+    interactive = not args.non_interactive and sys.stdin.isatty()
+
     print("==========================================")
     print("   P2P BANK NODE - HACKER EDITION v1.0    ")
     print("==========================================")
 
     # 1. Výběr jazyka (Znovupoužitelnost v praxi)
-    print("Choose language / Vyberte jazyk / Choisissez la langue")
-    lang = input("(cs / en / fr) [default: cs]: ").strip().lower()
-    
-    if not lang:
-        lang = 'cs'
+    lang = args.lang
+    if lang is None and interactive:
+        print("Choose language / Vyberte jazyk / Choisissez la langue")
+        lang = input("(cs / en / fr) [default: cs]: ")
+    lang = (lang or 'cs').strip().lower()
     
     if i18n.set_language(lang):
         print(f"OK. Language set to: {lang.upper()}")
@@ -38,21 +146,48 @@ def main():
         i18n.set_language('cs')
 
     # 2. Nastavení portu (Volitelné, aby se dalo spustit více bank na jednom PC)
-    port_input = input(f"Port [{DEFAULT_PORT}]: ").strip()
-    if port_input.isdigit():
-        port = int(port_input)
-    else:
+    port = args.port
+    if port is None and interactive:
+        port_input = input(f"Port [{DEFAULT_PORT}]: ").strip()
+        if port_input.isdigit():
+            port = int(port_input)
+    if port is None:
         port = DEFAULT_PORT
 
     if not (65525 <= port <= 65535):
         print("!! VAROVÁNÍ: Port je mimo povolený rozsah zadání (65525-65535) !!")
 
-    # 3. Inicializace komponent
+    # Volba síťového enginu (async zvládne tisíce nečinných spojení bez vláken)
+    engine = args.engine
+    if engine is None and interactive:
+        engine = input(f"Engine (thread / async) [{DEFAULT_ENGINE}]: ")
+    engine = (engine or "").strip().lower()
+    if engine not in ("thread", "async"):
+        engine = DEFAULT_ENGINE
+
+    # Čekání na dotazy se do time-to-ready nepočítá
+    started_at = time.perf_counter() if interactive else STARTED_AT
+
+    # 3. Inicializace komponent (úložiště se načítá na pozadí, server už přijímá spojení)
     print("Initializing Core Logic...")
-    controller = BankController()  # Načte data.json
+    data_file = args.data or STORAGE_FILES[args.storage_engine]
+    controller = BankController(data_file, shards=args.shards, engine=args.storage_engine,
+                                my_ip=args.ip, background_load=True,
+                                durability=args.durability,
+                                proxy_cache_ttl=args.proxy_cache_ttl, proxy_cache_size=PROXY_CACHE_SIZE)
 
     print("Initializing Network Layer...")
-    server = BankServer(HOST, port, controller, timeout=TIMEOUT)
+    if engine == "async":
+        server = AsyncBankServer(args.host, port, controller, timeout=TIMEOUT,
+                                 backlog=BACKLOG, rate_limit=RATE_LIMIT, rate_burst=RATE_BURST)
+    else:
+        server = BankServer(args.host, port, controller, timeout=TIMEOUT,
+                            workers=WORKERS, max_connections=MAX_CONNECTIONS,
+                            backlog=BACKLOG, rate_limit=RATE_LIMIT, rate_burst=RATE_BURST,
+                            fair_slots=FAIR_SLOTS)
+
+    if METRICS_FILE:
+        metrics.start_file_exporter(METRICS_FILE)
 
     # 4. Registrace "záchranné brzdy" (Ctrl+C)
     signal.signal(signal.SIGINT, signal_handler)
@@ -62,9 +197,15 @@ def main():
     print(f"My IP: {controller.my_ip}")
     print("Ready to accept connections. Press Ctrl+C to stop.")
     print("------------------------------------------")
+    threading.Thread(target=report_ready, args=(server, controller, started_at),
+                     name="startup-report", daemon=True).start()
     
     # Toto zablokuje hlavní vlákno, dokud server neběží
-    server.start()
+    try:
+        server.start()
+    finally:
+        # Ctrl+C (sys.exit v signal_handler) i pád serveru: uložit stav úložiště
+        controller.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,73 @@
+"""
+Převod účtů mezi formáty úložiště (podle přípony souboru):
+  *.json - JSON snapshot (+ nepřehraný *.json.wal), *.bin - binární snapshot,
+  *.db   - SQLite databáze.
+Spuštění:  python migrate.py [--source data.json] [--target data.db] [--replace]
+Např. data.json -> data.bin (a zpět) nebo data.json -> data.db; pak v main.py
+nastavte STORAGE_ENGINE / STORAGE_FILES na nový soubor.
+"""
+import argparse
+import os
+import sys
+import time
+
+from storage import LedgerStorage, SqliteStorage, snapshot_storage_for
+
+SQLITE_SUFFIX = ".db"
+
+
+def read_accounts(filename):
+    """Vrátí ({cislo: zustatek}, (součet, počet)) ze zdrojového souboru."""
+    if filename.endswith(SQLITE_SUFFIX):
+        source = SqliteStorage(filename)
+    else:
+        source = LedgerStorage(filename, allocate=False)  # Přehraje i WAL
+    try:
+        return source.snapshot(), source.totals()
+    finally:
+        source.close()
+
+
+def write_accounts(filename, data, replace):
+    """Zapíše účty do cíle, vrátí (součet, počet) přečtené zpět z cíle."""
+    if filename.endswith(SQLITE_SUFFIX):
+        target = SqliteStorage(filename)
+        try:
+            target.import_accounts(data, replace=replace)
+            return target.totals()
+        finally:
+            target.close()
+
+    if os.path.exists(filename) and not replace:
+        raise ValueError(f"{filename} už existuje")
+    storage = snapshot_storage_for(filename)
+    storage.save(data)
+    written = storage.load()
+    return (sum(written.values()), len(written)) if written == data else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default="data.json", help="zdroj (.json, .bin nebo .db)")
+    parser.add_argument("--target", default="data.db", help="cíl (.json, .bin nebo .db)")
+    parser.add_argument("--replace", action="store_true",
+                        help="povolí zápis do existujícího cíle (snapshot přepíše, do SQLite účty doplní)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    data, expected = read_accounts(args.source)
+    try:
+        result = write_accounts(args.target, data, args.replace)
+    except ValueError as e:
+        print(f"Chyba: {e} (použijte --replace)")
+        sys.exit(1)
+
+    print(f"Převedeno {len(data)} účtů za {time.perf_counter() - started:.2f} s -> {args.target}.")
+    if result is None or (not args.replace and result != expected):
+        print(f"Chyba: cíl neodpovídá zdroji (součet, počet) {expected} != {result}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,166 @@
+import asyncio
+import logging
 import socket
 import threading
-from shared import i18n
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+from shared import i18n, LineBuffer, metrics
+
+# Jak dlouho čekat na dokončení řádku bez '\n'. Starší klienti posílají
+# příkaz bez ukončovacího znaku - po této pauze ho zpracujeme tak, jak je.
+PARTIAL_LINE_TIMEOUT = 0.3
+
+log = logging.getLogger("bank.network")
+traffic = logging.getLogger("bank.traffic")  # Zprávy RECV/SENT - vzorkované
+
+active_connections = metrics.gauge("bank_active_connections", "Právě obsluhovaná spojení")
+rejected_connections = metrics.counter("bank_rejected_connections_total", "Spojení odmítnutá kvůli přetížení")
+metrics.gauge("bank_threads", "Počet vláken procesu", func=threading.active_count)
+throttled_requests = metrics.counter("bank_throttled_requests_total", "Příkazy odmítnuté limitem na IP")
+scheduler_waits = metrics.counter("bank_scheduler_waits_total", "Příkazy, které čekaly ve férové frontě")
+scheduler_timeouts = metrics.counter("bank_scheduler_timeouts_total", "Příkazy, které se z férové fronty nedostaly včas")
+
+
+class RateLimiter:
+    """
+    Token bucket pro každou zdrojovou IP: rate příkazů za sekundu,
+    nárazově až burst. Nad limit allow() vrátí False (server odpoví rychlým ER
+    a se čtením dalších příkazů z toho spojení počká na retry_after).
+    Plné (dlouho nečinné) buckety se zahazují, aby tabulka nerostla.
+    """
+    def __init__(self, rate, burst=None, max_ips=10000):
+        self.rate = rate
+        self.burst = burst or rate
+        self.max_ips = max_ips
+        self._buckets = {}  # ip -> [tokeny, čas posledního doplnění]
+        self._lock = threading.Lock()
+
+    def allow(self, ip):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(ip)
+            if bucket is None:
+                if len(self._buckets) >= self.max_ips:
+                    self._evict(now)
+                bucket = self._buckets[ip] = [self.burst, now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+    def retry_after(self, ip, count=1):
+        """Za kolik sekund bude mít IP zase count tokenů (pro zpomalení čtení ze spojení)."""
+        with self._lock:
+            bucket = self._buckets.get(ip)
+            if bucket is None:
+                return 0.0
+            return max(0.0, (count - bucket[0]) / self.rate)
+
+    def _evict(self, now):
+        """Zahodí buckety, které by už byly zase plné (IP dlouho nic neposlala)."""
+        refill = self.burst / self.rate
+        for ip, (_, updated) in list(self._buckets.items()):
+            if now - updated >= refill:
+                del self._buckets[ip]
+
+
+class FairScheduler:
+    """
+    Férové řazení příkazů při zahlcení: najednou se provádí nejvýš slots
+    příkazů. Když je plno, čekající se obslouží po kolech podle IP
+    (round-robin), ne podle toho, kdo jich poslal víc - agresivní klient
+    s mnoha spojeními nebo dlouhou dávkou tak nevyhladoví ostatní.
+    Bez zahlcení stojí jen jedno vzetí zámku.
+    """
+    def __init__(self, slots):
+        self.slots = slots
+        self._free = slots
+        self._queues = {}     # ip -> deque[čekající (Event)]
+        self._ring = deque()  # IP s čekajícími, v pořadí obsluhy
+        self._lock = threading.Lock()
+
+    def acquire(self, ip, timeout=None):
+        """Počká na slot; vrátí False, pokud ho do timeout nedostal."""
+        with self._lock:
+            if self._free and not self._ring:
+                self._free -= 1
+                return True
+            ticket = threading.Event()
+            queue = self._queues.get(ip)
+            if queue is None:
+                queue = self._queues[ip] = deque()
+                self._ring.append(ip)
+            queue.append(ticket)
+        scheduler_waits.inc()
+        if ticket.wait(timeout):
+            return True
+        with self._lock:
+            if ticket.is_set():
+                return True  # Slot přišel těsně po timeoutu
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ip]
+                self._ring.remove(ip)
+        scheduler_timeouts.inc()
+        return False
+
+    def release(self):
+        """Uvolní slot - předá ho další IP v pořadí (nebo vrátí do volných)."""
+        with self._lock:
+            if not self._ring:
+                self._free += 1
+                return
+            ip = self._ring.popleft()
+            queue = self._queues[ip]
+            queue.popleft().set()
+            if queue:
+                self._ring.append(ip)  # Na další ticket této IP dojde až po ostatních
+            else:
+                del self._queues[ip]
+
 
 class BankServer:
     """
     Síťová vrstva serveru.
     Stará se o přijímání spojení a vytváření vláken pro klienty.
+
+    Režimy:
+    - workers=None: pro každého klienta nové vlákno (původní chování),
+    - workers=N: pevný pool N daemon vláken nad frontou spojení.
+    max_connections omezuje počet obsluhovaných + čekajících spojení,
+    nad limit dostane klient okamžitě odpověď "ER busy".
+    Vlákna jsou v obou režimech daemon: klient visící v recv() (timeout)
+    nesmí při Ctrl+C blokovat ukončení programu.
+
+    Ochrana před agresivními klienty (výchozí: vypnuto):
+    - rate_limit / rate_burst: token bucket na zdrojovou IP (příkazy/s),
+      nad limit okamžitá odpověď ER (viz RateLimiter),
+    - fair_slots: nejvýš tolik příkazů najednou, při zahlcení se čekající
+      střídají po IP (viz FairScheduler); kdo nedostane slot do timeout, dostane "ER busy".
     """
-    def __init__(self, host, port, controller, timeout=5.0):
+    def __init__(self, host, port, controller, timeout=5.0,
+                 workers=None, max_connections=None, backlog=5,
+                 rate_limit=None, rate_burst=None, fair_slots=None):
         self.host = host
         self.port = port
         self.controller = controller  # Instance BankController z logic.py
         self.timeout = timeout
+        self.workers = workers
+        self.max_connections = max_connections
+        self.backlog = backlog
         self.server_socket = None
         self.is_running = False
+        self.listening = threading.Event()  # Nastaví se, jakmile server přijímá spojení
+        self._queue = None  # Fronta spojení pro pool workerů
+        # Sloty pro spojení (aktivní + čekající ve frontě poolu)
+        self._slots = threading.BoundedSemaphore(max_connections) if max_connections else None
+        self.limiter = RateLimiter(rate_limit, rate_burst) if rate_limit else None
+        self.scheduler = FairScheduler(fair_slots) if fair_slots else None
 
     def start(self):
         """Spustí hlavní smyčku serveru."""
@@ -25,20 +172,41 @@ class BankServer:
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             
             self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5) # Fronta pro 5 čekajících spojení
+            self.server_socket.listen(self.backlog) # Fronta čekajících spojení v jádře OS
             self.is_running = True
+            self.listening.set()
+
+            if self.workers:
+                self._queue = Queue(maxsize=self.max_connections or 0)
+                for index in range(self.workers):
+                    threading.Thread(target=self._worker_loop, name=f"bank-worker-{index}",
+                                     daemon=True).start()
 
-            print(f"Server naslouchá na {self.host}:{self.port}...")
-            print(f"{i18n.get('MSG_SERVER_STARTED')} {self.port}")
+            log.info("Server naslouchá na %s:%s...", self.host, self.port)
+            log.info("%s %s", i18n.get('MSG_SERVER_STARTED'), self.port)
 
             while self.is_running:
                 try:
                     # Hlavní vlákno zde "visí" a čeká na nového klienta
                     client_sock, addr = self.server_socket.accept()
+
+                    # Plno -> rychlé odmítnutí místo dalšího vlákna
+                    if self._slots and not self._slots.acquire(blocking=False):
+                        self._reject_busy(client_sock)
+                        continue
+
+                    if self._queue is not None:
+                        # Pool: spojení čeká ve frontě, dokud se neuvolní worker
+                        try:
+                            self._queue.put_nowait((client_sock, addr))
+                        except Full:
+                            self._release_slot()
+                            self._reject_busy(client_sock)
+                        continue
                     
                     # Jakmile se někdo připojí, okamžitě pro něj vyrobíme vlákno
                     client_thread = threading.Thread(
-                        target=self.handle_client,
+                        target=self._serve,
                         args=(client_sock, addr)
                     )
                     # Daemon = True zajistí, že se vlákna ukončí, když vypneme hlavní program
@@ -49,10 +217,10 @@ class BankServer:
                     # Nastane při vypínání serveru (socket se zavře)
                     break
                 except Exception as e:
-                    print(f"[SERVER ERROR] {e}")
+                    log.error("Chyba serveru: %s", e)
 
         except Exception as e:
-            print(f"[CRITICAL] Nepodařilo se spustit server: {e}")
+            log.critical("Nepodařilo se spustit server: %s", e)
         finally:
             self.stop()
 
@@ -60,48 +228,261 @@ class BankServer:
         """Bezpečně ukončí server."""
         self.is_running = False
         if self.server_socket:
+            try:
+                # shutdown probudí vlákno visící v accept() (samotné close to na Linuxu neudělá)
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
             self.server_socket.close()
+        if self._queue is not None:
+            for _ in range(self.workers):
+                try:
+                    self._queue.put_nowait(None)  # Volné workery skončí, obsazené jsou daemon
+                except Full:
+                    break
+
+    def _worker_loop(self):
+        """Worker poolu: bere spojení z fronty, dokud nedostane None."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._serve(*item)
+
+    def _reject_busy(self, conn):
+        """Odmítne spojení, když je server plný (bez čekání na klienta)."""
+        rejected_connections.inc()
+        try:
+            conn.sendall((i18n.get("ERR_SERVER_BUSY") + "\n").encode('utf-8'))
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def _serve(self, conn, addr):
+        """Obslouží klienta a vrátí jeho slot."""
+        active_connections.inc()
+        try:
+            self.handle_client(conn, addr)
+        finally:
+            active_connections.dec()
+            self._release_slot()
+
+    def _release_slot(self):
+        if self._slots:
+            self._slots.release()
 
     def handle_client(self, conn, addr):
         """
         Logika pro obsluhu jednoho konkrétního klienta.
         Běží ve vlastním vlákně.
+        Příkazy jsou oddělené '\n'; klient jich může poslat víc najednou
+        (pipelining) - zpracují se popořadě a odpovědi odejdou jedním sendall.
         """
         ip, port = addr
-        print(f"[NEW CONNECTION] {ip}:{port}")
+        traffic.debug("[NEW CONNECTION] %s:%s", ip, port)
         
         # Nastavení timeoutu pro toto spojení (podle zadání)
         conn.settimeout(self.timeout)
+        buffer = LineBuffer()
 
         try:
             while True:
-                # Čekáme na data. 1024 bytů je pro textové příkazy až až.
-                data = conn.recv(1024)
-                
-                if not data:
-                    # Pokud přišlo "nic", znamená to, že klient ukončil spojení.
-                    break
-                
-                # Dekódování a zpracování
-                command_text = data.decode('utf-8').strip()
-                if not command_text:
-                    continue # Ignorujeme prázdné řádky
-                
-                print(f"[{ip}] RECV: {command_text}")
-                
-                # Zde voláme MOZEK (logic.py)
-                response_text = self.controller.process_command(command_text)
-                
-                # Odeslání odpovědi
-                conn.sendall((response_text + "\n").encode('utf-8'))
-                print(f"[{ip}] SENT: {response_text}")
+                try:
+                    data = conn.recv(4096)
+                except socket.timeout:
+                    if not buffer.partial:
+                        raise
+                    # Klient neposlal '\n' (starší implementace) -> bereme, co přišlo
+                    lines = [buffer.take_partial()]
+                else:
+                    if not data:
+                        # Pokud přišlo "nic", znamená to, že klient ukončil spojení.
+                        break
+                    lines = buffer.feed(data)
+
+                responses = []
+                throttled = 0
+                for command_text in lines:
+                    if not command_text:
+                        continue # Ignorujeme prázdné řádky
+
+                    traffic.debug("[%s] RECV: %s", ip, command_text, extra={"ip": ip})
+
+                    # Zde voláme MOZEK (logic.py)
+                    if self.limiter and not self.limiter.allow(ip):
+                        throttled += 1
+                        responses.append(i18n.get("ERR_THROTTLED"))
+                        continue
+                    responses.append(self._execute(ip, command_text))
+
+                # Odeslání všech odpovědí najednou
+                if responses:
+                    conn.sendall(("\n".join(responses) + "\n").encode('utf-8'))
+                    for response_text in responses:
+                        traffic.debug("[%s] SENT: %s", ip, response_text, extra={"ip": ip})
+
+                # Přes limit -> další příkazy nečteme, dokud by odmítnuté neprošly (TCP klienta přibrzdí)
+                if throttled:
+                    throttled_requests.inc(throttled)
+                    time.sleep(min(self.limiter.retry_after(ip, throttled), self.timeout))
+
+                # Nedokončený řádek -> krátké čekání na zbytek
+                conn.settimeout(PARTIAL_LINE_TIMEOUT if buffer.partial else self.timeout)
 
         except socket.timeout:
-            print(f"[{ip}] TIMEOUT - klient byl příliš dlouho neaktivní.")
+            log.debug("[%s] TIMEOUT - klient byl příliš dlouho neaktivní.", ip)
         except ConnectionResetError:
-            print(f"[{ip}] DISCONNECT - klient násilně ukončil spojení.")
+            log.info("[%s] DISCONNECT - klient násilně ukončil spojení.", ip)
         except Exception as e:
-            print(f"[{ip}] ERROR: {e}")
+            log.warning("[%s] ERROR: %s", ip, e)
         finally:
             conn.close()
-            print(f"[{ip}] Spojení uzavřeno.")
\ No newline at end of file
+            traffic.debug("[%s] Spojení uzavřeno.", ip)
+
+    def _execute(self, ip, command_text):
+        """Provede příkaz přes férový plánovač (je-li zapnutý)."""
+        if not self.scheduler:
+            return self.controller.process_command(command_text)
+        if not self.scheduler.acquire(ip, self.timeout):
+            return i18n.get("ERR_SERVER_BUSY")
+        try:
+            return self.controller.process_command(command_text)
+        finally:
+            self.scheduler.release()
+
+
+class AsyncBankServer:
+    """
+    Alternativní síťová vrstva postavená na asyncio.
+    Jedno vlákno obsluhuje všechna spojení (i desítky tisíc nečinných),
+    blokující BankController.process_command běží v poolu vláken
+    a proxy příkazy se přeposílají neblokujícím socketem.
+    """
+    def __init__(self, host, port, controller, timeout=5.0,
+                 executor_workers=32, backlog=128, rate_limit=None, rate_burst=None):
+        self.host = host
+        self.port = port
+        self.controller = controller  # Instance BankController z logic.py
+        self.timeout = timeout
+        self.executor_workers = executor_workers
+        self.backlog = backlog
+        self.loop = None
+        self.server = None
+        self.listening = threading.Event()  # Nastaví se, jakmile server přijímá spojení
+        # Limit příkazů na IP jako u BankServer (férové pořadí tu řeší event loop)
+        self.limiter = RateLimiter(rate_limit, rate_burst) if rate_limit else None
+
+    def start(self):
+        """Spustí event loop serveru (blokuje, dokud server běží)."""
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            log.critical("Nepodařilo se spustit server: %s", e)
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop.set_default_executor(
+            ThreadPoolExecutor(max_workers=self.executor_workers,
+                               thread_name_prefix="bank-exec"))
+
+        self.server = await asyncio.start_server(
+            self.handle_client, self.host, self.port,
+            backlog=self.backlog, reuse_address=True)
+        self.listening.set()
+
+        log.info("Server (asyncio) naslouchá na %s:%s...", self.host, self.port)
+        log.info("%s %s", i18n.get('MSG_SERVER_STARTED'), self.port)
+
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+    def stop(self):
+        """Bezpečně ukončí server (lze volat z jiného vlákna)."""
+        if self.loop and self.server:
+            self.loop.call_soon_threadsafe(self.server.close)
+
+    async def _execute(self, command_text):
+        """Proxy příkazy přepošle asynchronně, ostatní předá do poolu vláken."""
+        # Nejdřív levné rozhodnutí; modul hacker (net_client) se načte až pro první proxy příkaz
+        target_ip = self.controller.proxy_target(command_text)
+        net_client = self.controller.net_client if target_ip else None
+        if net_client:
+            started = time.perf_counter()
+            cached, ticket = self.controller.begin_proxy(command_text)
+            if cached is not None:
+                response = cached
+            else:
+                log.debug("Proxy příkazu na %s", target_ip)
+                response = await net_client.send_command_async(target_ip, command_text)
+                self.controller.end_proxy(ticket, response)
+            # Mimo process_command -> metriky příkazu zapíšeme sami
+            self.controller.record_command(command_text, started, response)
+            return response
+
+        return await self.loop.run_in_executor(
+            None, self.controller.process_command, command_text)
+
+    async def handle_client(self, reader, writer):
+        """
+        Logika pro obsluhu jednoho klienta.
+        Běží jako korutina, ne jako samostatné vlákno.
+        """
+        ip, port = writer.get_extra_info('peername')[:2]
+        traffic.debug("[NEW CONNECTION] %s:%s", ip, port)
+        buffer = LineBuffer()
+        active_connections.inc()
+
+        try:
+            while True:
+                # Timeout nečinnosti stejně jako u BankServer
+                wait = PARTIAL_LINE_TIMEOUT if buffer.partial else self.timeout
+                try:
+                    data = await asyncio.wait_for(reader.read(4096), wait)
+                except asyncio.TimeoutError:
+                    if not buffer.partial:
+                        raise
+                    lines = [buffer.take_partial()]
+                else:
+                    if not data:
+                        break
+                    lines = buffer.feed(data)
+
+                responses = []
+                throttled = 0
+                for command_text in lines:
+                    if not command_text:
+                        continue
+
+                    traffic.debug("[%s] RECV: %s", ip, command_text, extra={"ip": ip})
+                    if self.limiter and not self.limiter.allow(ip):
+                        throttled += 1
+                        responses.append(i18n.get("ERR_THROTTLED"))
+                        continue
+                    responses.append(await self._execute(command_text))
+
+                if responses:
+                    writer.write(("\n".join(responses) + "\n").encode('utf-8'))
+                    await writer.drain()
+                    for response_text in responses:
+                        traffic.debug("[%s] SENT: %s", ip, response_text, extra={"ip": ip})
+
+                if throttled:
+                    throttled_requests.inc(throttled)
+                    await asyncio.sleep(min(self.limiter.retry_after(ip, throttled), self.timeout))
+
+        except asyncio.TimeoutError:
+            log.debug("[%s] TIMEOUT - klient byl příliš dlouho neaktivní.", ip)
+        except ConnectionResetError:
+            log.info("[%s] DISCONNECT - klient násilně ukončil spojení.", ip)
+        except asyncio.CancelledError:
+            pass  # Vypínání serveru
+        except Exception as e:
+            log.warning("[%s] ERROR: %s", ip, e)
+        finally:
+            active_connections.dec()
+            writer.close()
+            traffic.debug("[%s] Spojení uzavřeno.", ip)
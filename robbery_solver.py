@@ -0,0 +1,185 @@
+import math
+import time
+
+
+class RobberyPlan:
+    """
+    Výsledek výběru bank k vyloupení.
+    lower_bound je dolní mez počtu poškozených klientů - pokud se rovná
+    victims, je řešení prokazatelně optimální.
+    """
+    def __init__(self, banks, money, victims, lower_bound, method):
+        self.banks = banks  # Seznam kandidátů {'ip', 'money', 'clients'}
+        self.money = money
+        self.victims = victims
+        self.lower_bound = lower_bound
+        self.method = method
+
+    @property
+    def optimal(self):
+        return self.victims <= self.lower_bound
+
+    @property
+    def gap(self):
+        """Relativní mezera k optimu (0.0 = optimální)."""
+        if self.optimal or not self.victims:
+            return 0.0
+        return (self.victims - self.lower_bound) / self.victims
+
+
+def greedy(candidates, target):
+    """
+    Původní hladový algoritmus: banky podle poměru peníze/klient sestupně,
+    bereme, dokud nemáme target. Rychlý, ale nemusí být optimální.
+    """
+    # (Abychom se vyhnuli dělení nulou, počítáme banku bez klientů jako 0.1 klienta)
+    ordered = sorted(candidates,
+                     key=lambda x: x['money'] / (x['clients'] if x['clients'] > 0 else 0.1),
+                     reverse=True)
+    banks, money, victims = [], 0, 0
+    for bank in ordered:
+        if money >= target:
+            break
+        banks.append(bank)
+        money += bank['money']
+        victims += bank['clients']
+    return RobberyPlan(banks, money, victims, 0, "greedy")
+
+
+def _fractional_bound(items, start, missing):
+    """
+    LP relaxace: kolik klientů minimálně (i zlomkově) stojí dobrat `missing`
+    peněz z položek od indexu `start` (seřazených podle efektivity).
+    Vrací math.inf, pokud to nejde.
+    """
+    clients = 0.0
+    for money, victims, _ in items[start:]:
+        if money >= missing:
+            return clients + victims * missing / money
+        missing -= money
+        clients += victims
+    return math.inf
+
+
+def _solve_dp(items, target, max_victims):
+    """
+    0/1 knapsack přes počet klientů: best[c] = max. peníze s nejvýš c klienty.
+    Hledáme nejmenší c, kde best[c] >= target. Složitost O(n * max_victims).
+    """
+    best = [0] * (max_victims + 1)
+    taken = []  # taken[i][c - w] == 1 -> v kroku i se na c vzala položka i
+    for money, victims, _ in items:
+        if victims > max_victims:
+            taken.append(b"")
+            continue
+        tail = best[victims:]
+        shifted = [value + money for value in best[:len(tail)]]
+        new_tail = list(map(max, tail, shifted))
+        taken.append(bytes(new != old for new, old in zip(new_tail, tail)))
+        best[victims:] = new_tail
+
+    for capacity, value in enumerate(best):
+        if value >= target:
+            break
+    else:
+        return None
+
+    chosen = []
+    c = capacity
+    for i in range(len(items) - 1, -1, -1):
+        victims = items[i][1]
+        if victims <= c and taken[i] and taken[i][c - victims]:
+            chosen.append(items[i])
+            c -= victims
+    return chosen
+
+
+def _solve_branch_and_bound(items, target, incumbent, deadline):
+    """
+    Prohledávání do hloubky s ořezáváním přes LP mez.
+    incumbent = (klienti, vybrané položky) z hladového řešení.
+    Vrací (nejlepší řešení, dokončeno_včas).
+    """
+    best_victims, best_chosen = incumbent
+    stack = [(0, 0, 0, ())]  # (index, peníze, klienti, vybrané indexy)
+    nodes = 0
+
+    while stack:
+        nodes += 1
+        if nodes % 1024 == 0 and time.monotonic() > deadline:
+            return (best_victims, best_chosen), False
+
+        i, money, victims, chosen = stack.pop()
+        if money >= target:
+            if victims < best_victims:
+                best_victims, best_chosen = victims, [items[j] for j in chosen]
+            continue
+        if i == len(items):
+            continue
+        bound = _fractional_bound(items, i, target - money)
+        if bound == math.inf or victims + math.ceil(bound - 1e-9) >= best_victims:
+            continue
+
+        # Nejdřív větev "vzít" (na vrcholu zásobníku), pak "nevzít"
+        item_money, item_victims, _ = items[i]
+        stack.append((i + 1, money, victims, chosen))
+        stack.append((i + 1, money + item_money, victims + item_victims, chosen + (i,)))
+
+    return (best_victims, best_chosen), True
+
+
+def solve(candidates, target, time_budget=0.5, dp_limit=5_000_000):
+    """
+    Najde podmnožinu bank s penězi >= target a minimálním počtem klientů.
+    - Banky bez klientů bereme vždy (nikoho nepoškodí).
+    - Malé instance (n * klienti <= dp_limit) řeší přesně dynamické programování.
+    - Velké řeší branch-and-bound s časovým limitem time_budget sekund;
+      po vypršení vrátí nejlepší nalezené řešení a mezeru k dolní mezi.
+    Pokud v síti není dost peněz, vrátí všechny banky (maximální kořist).
+    """
+    candidates = [c for c in candidates if c['money'] > 0]
+    if target <= 0:
+        return RobberyPlan([], 0, 0, 0, "trivial")
+
+    total = sum(c['money'] for c in candidates)
+    if total < target:
+        victims = sum(c['clients'] for c in candidates)
+        return RobberyPlan(list(candidates), total, victims, victims, "all")
+
+    free = [c for c in candidates if c['clients'] <= 0]
+    free_money = sum(c['money'] for c in free)
+    missing = target - free_money
+    if missing <= 0:
+        # Stačí jen banky bez klientů (bereme nejbohatší, dokud nestačí)
+        free.sort(key=lambda c: c['money'], reverse=True)
+        banks, money = [], 0
+        for bank in free:
+            if money >= target:
+                break
+            banks.append(bank)
+            money += bank['money']
+        return RobberyPlan(banks, money, 0, 0, "trivial")
+
+    # Položky (peníze, klienti, kandidát) seřazené podle efektivity
+    items = sorted(((c['money'], c['clients'], c) for c in candidates if c['clients'] > 0),
+                   key=lambda item: item[0] / item[1], reverse=True)
+    lower_bound = math.ceil(_fractional_bound(items, 0, missing) - 1e-9)
+
+    start = greedy([item[2] for item in items], missing)
+    incumbent = (start.victims, [(b['money'], b['clients'], b) for b in start.banks])
+
+    if len(items) * (incumbent[0] + 1) <= dp_limit:
+        chosen = _solve_dp(items, missing, incumbent[0])
+        method = "dp"
+        lower_bound = sum(item[1] for item in chosen)
+    else:
+        deadline = time.monotonic() + time_budget
+        (_, chosen), finished = _solve_branch_and_bound(items, missing, incumbent, deadline)
+        method = "bnb"
+        if finished:
+            lower_bound = sum(item[1] for item in chosen)
+
+    banks = free + [item[2] for item in chosen]
+    money = sum(b['money'] for b in banks)
+    victims = sum(item[1] for item in chosen)
+    return RobberyPlan(banks, money, victims, lower_bound, method)
@@ -3,6 +3,16 @@ import threading
 import os
 import tempfile
 import shutil
+import atexit
+import itertools
+import logging
+import logging.handlers
+import queue
+import bisect
+import weakref
+import socket
+import struct
+import time
 
 class LocalizationManager:
     """
@@ -47,6 +57,31 @@ class LocalizationManager:
                 "en": "ER Cannot delete account with remaining funds.",
                 "fr": "ER Impossible de supprimer un compte avec des fonds."
             },
+            "ERR_BATCH_ABORTED": {
+                "cs": "ER Dávka zrušena (jiná operace selhala).",
+                "en": "ER Batch aborted (another operation failed).",
+                "fr": "ER Lot annulé (une autre opération a échoué)."
+            },
+            "ERR_NO_ACCOUNT_NUMBERS": {
+                "cs": "ER Banka už nemá volná čísla účtů.",
+                "en": "ER No free account numbers left.",
+                "fr": "ER Plus aucun numéro de compte disponible."
+            },
+            "ERR_STARTING": {
+                "cs": "ER Banka se ještě načítá, zkuste to za chvíli.",
+                "en": "ER Bank is still starting, try again shortly.",
+                "fr": "ER La banque démarre encore, réessayez dans un instant."
+            },
+            "ERR_SERVER_BUSY": {
+                "cs": "ER Server je přetížený, zkuste to později.",
+                "en": "ER Server busy, try again later.",
+                "fr": "ER Serveur surchargé, réessayez plus tard."
+            },
+            "ERR_THROTTLED": {
+                "cs": "ER Příliš mnoho požadavků, zpomalte.",
+                "en": "ER Too many requests, slow down.",
+                "fr": "ER Trop de requêtes, ralentissez."
+            },
             "MSG_SERVER_STARTED": {
                 "cs": "Server spuštěn na portu",
                 "en": "Server started on port",
@@ -74,6 +109,326 @@ class LocalizationManager:
         return msg_dict.get(self.current_lang, msg_dict.get('en')) 
 
 
+class LineBuffer:
+    """
+    Univerzální rozdělovač proudu bajtů (TCP) na textové řádky.
+    TCP nezaručuje, že jeden recv() = jedna zpráva: zprávy mohou přijít
+    rozdělené i slepené. Buffer drží nedokončený řádek, dokud nepřijde '\n'.
+    """
+    def __init__(self, max_line=65536):
+        self.max_line = max_line
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Přidá přijatá data a vrátí seznam všech kompletních řádků (bez '\r\n')."""
+        self._buffer += data
+        if b"\n" not in data:
+            if len(self._buffer) > self.max_line:
+                raise ValueError("Line too long")
+            return []
+
+        *complete, rest = self._buffer.split(b"\n")
+        self._buffer = bytearray(rest)
+        return [line.decode('utf-8', errors='replace').strip() for line in complete]
+
+    @property
+    def partial(self):
+        """True, pokud buffer drží začátek řádku bez '\n'."""
+        return bool(self._buffer)
+
+    def take_partial(self):
+        """Vrátí (a vyprázdní) nedokončený řádek."""
+        line = self._buffer.decode('utf-8', errors='replace').strip()
+        self._buffer = bytearray()
+        return line
+
+
+class _ThreadCells:
+    """
+    Hodnoty metriky rozdělené po vláknech: každé vlákno zapisuje do vlastní
+    buňky (seznam čísel) bez zámku, čtení buňky sečte. Když vlákno skončí,
+    jeho buňka se přičte k uzavřeným (vlákno na klienta tak nenechává
+    za sebou rostoucí seznam buněk).
+    """
+    def __init__(self, template):
+        self.template = template
+        self.local = threading.local()  # .cell = buňka aktuálního vlákna
+        self._cells = {}  # id(buňka) -> buňka živého vlákna
+        self._closed = list(template)
+        self._lock = threading.Lock()
+
+    def new_cell(self):
+        cell = list(self.template)
+        owner = _CellOwner()
+        self.local.cell = cell
+        self.local.owner = owner  # Zanikne s thread-local vlákna -> finalize
+        with self._lock:
+            self._cells[id(cell)] = cell
+        weakref.finalize(owner, self._close_cell, cell)
+        return cell
+
+    def _close_cell(self, cell):
+        with self._lock:
+            del self._cells[id(cell)]
+            for index, value in enumerate(cell):
+                self._closed[index] += value
+
+    def totals(self):
+        with self._lock:
+            totals = list(self._closed)
+            for cell in self._cells.values():
+                for index, value in enumerate(cell):
+                    totals[index] += value
+        return totals
+
+
+class _CellOwner:
+    """Značka v thread-local; její zánik (konec vlákna) uzavře buňku vlákna."""
+    __slots__ = ("__weakref__",)
+
+
+class Counter:
+    """Monotónní čítač (např. počet příkazů). inc() je bez zámku (viz _ThreadCells)."""
+    kind = "counter"
+
+    def __init__(self):
+        self._cells = _ThreadCells([0])
+        self._local = self._cells.local
+
+    def inc(self, amount=1):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._cells.new_cell()
+        cell[0] += amount
+
+    @property
+    def value(self):
+        return self._cells.totals()[0]
+
+
+class Gauge:
+    """Okamžitá hodnota. Může být i funkce, která se vyhodnotí při čtení."""
+    kind = "gauge"
+
+    def __init__(self, func=None):
+        self._value = 0
+        self._func = func
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        return self._func() if self._func else self._value
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class Histogram:
+    """
+    Histogram latencí s pevnými hranicemi (v sekundách).
+    observe() je O(log počtu košů) a nealokuje, takže může běžet stále.
+    Koše a součet se zapisují bez zámku do buňky vlákna (viz _ThreadCells).
+    """
+    kind = "histogram"
+    BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+               0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        # Buňka: [koš..., +Inf, součet]
+        self._cells = _ThreadCells([0] * (len(self.buckets) + 1) + [0.0])
+        self._local = self._cells.local
+
+    def observe(self, value, weight=1):
+        """
+        Zapíše jedno měření. Vzorkované měření (jen každé n-té volání)
+        se předá s weight=n, aby počet a součet odhadovaly všechna volání.
+        """
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._cells.new_cell()
+        cell[bisect.bisect_left(self.buckets, value)] += weight
+        cell[-1] += value * weight
+
+    def snapshot(self):
+        """Vrátí (počty v koších - poslední = +Inf, součet) sečtené přes všechna vlákna."""
+        totals = self._cells.totals()
+        return totals[:-1], totals[-1]
+
+    @property
+    def counts(self):
+        return self.snapshot()[0]
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    @property
+    def sum(self):
+        return self.snapshot()[1]
+
+    def quantile(self, q):
+        """Odhad kvantilu (horní hranice koše, do kterého kvantil padne)."""
+        counts = self.counts
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class MetricsRegistry:
+    """
+    Univerzální registr metrik (čítače, gauge, histogramy se štítky).
+    Umí kompaktní jednořádkový souhrn a textový formát Prometheus.
+    """
+    def __init__(self):
+        self._metrics = {}  # (jméno, štítky) -> metrika
+        self._help = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _get(self, factory, name, help_text, labels, *args):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = factory(*args)
+                    self._metrics[key] = metric
+                    self._help.setdefault(name, help_text)
+        return metric
+
+    def counter(self, name, help_text="", **labels):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text="", func=None, **labels):
+        return self._get(Gauge, name, help_text, labels, func)
+
+    def histogram(self, name, help_text="", **labels):
+        return self._get(Histogram, name, help_text, labels)
+
+    @staticmethod
+    def _label_str(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+    def summary(self):
+        """Jednořádkový souhrn: jmeno{stitky}=hodnota, u histogramů počet/p50/p99 v ms."""
+        parts = [f"uptime={time.time() - self.started:.0f}s"]
+        for (name, labels), metric in sorted(self._metrics.items()):
+            label_str = self._label_str(labels)
+            if metric.kind == "histogram":
+                parts.append(f"{name}{label_str}=n:{metric.count},"
+                             f"p50:{metric.quantile(0.5) * 1000:g}ms,"
+                             f"p99:{metric.quantile(0.99) * 1000:g}ms")
+            else:
+                parts.append(f"{name}{label_str}={metric.value}")
+        return " ".join(parts)
+
+    def render_prometheus(self):
+        """Textový formát Prometheus (exposition format 0.0.4)."""
+        lines = []
+        typed = set()
+        for (name, labels), metric in sorted(self._metrics.items()):
+            if name not in typed:
+                typed.add(name)
+                if self._help.get(name):
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+
+            if metric.kind != "histogram":
+                lines.append(f"{name}{self._label_str(labels)} {metric.value}")
+                continue
+
+            counts, total = metric.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = labels + (("le", bound),)
+                lines.append(f"{name}_bucket{self._label_str(le)} {cumulative}")
+            lines.append(f"{name}_sum{self._label_str(labels)} {total}")
+            lines.append(f"{name}_count{self._label_str(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def start_file_exporter(self, filename, interval=10.0):
+        """Na pozadí pravidelně (atomicky) zapisuje metriky do souboru pro Prometheus."""
+        def export_loop():
+            while True:
+                time.sleep(interval)
+                dir_name = os.path.dirname(filename) or '.'
+                tmp_fd, tmp_path = tempfile.mkstemp(dir=dir_name, text=True)
+                with os.fdopen(tmp_fd, 'w', encoding='utf-8') as tmp_file:
+                    tmp_file.write(self.render_prometheus())
+                os.replace(tmp_path, filename)
+
+        thread = threading.Thread(target=export_loop, name="metrics-exporter", daemon=True)
+        thread.start()
+        return thread
+
+
+# Globální registr metrik aplikace (příkaz MT, export pro Prometheus)
+metrics = MetricsRegistry()
+
+
+def _interface_ips():
+    """IPv4 adresy lokálních rozhraní (Linux, ioctl SIOCGIFADDR) - bez síťového provozu."""
+    try:
+        import fcntl
+    except ImportError:
+        return []  # Windows
+    SIOCGIFADDR = 0x8915
+    ips = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for _, name in socket.if_nameindex():
+            try:
+                request = struct.pack("256s", name.encode('utf-8')[:15])
+                ips.append(socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFADDR, request)[20:24]))
+            except OSError:
+                continue  # Rozhraní bez IPv4 adresy
+    return ips
+
+
+def discover_local_ip(override=None):
+    """
+    IP adresa tohoto uzlu (pro BC a rozhodnutí lokálně/proxy).
+    1. override (parametr --ip / BANK_IP),
+    2. první ne-loopback IPv4 z lokálních rozhraní,
+    3. zdrojová adresa výchozí trasy (UDP connect nic neodesílá, jen se zeptá jádra),
+    4. 127.0.0.1.
+    """
+    if override:
+        return override
+    try:
+        for ip in _interface_ips():
+            if not ip.startswith("127."):
+                return ip
+    except OSError:
+        pass
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("8.8.8.8", 80))
+            return s.getsockname()[0]
+    except OSError:
+        return "127.0.0.1"
+
+
 class ThreadSafeJsonStorage:
     """
     Bezpečné úložiště dat.
@@ -83,9 +438,18 @@ class ThreadSafeJsonStorage:
     def __init__(self, filename):
         self.filename = filename
         self.lock = threading.RLock() 
+        self._load_time = metrics.histogram("bank_storage_load_seconds", "Doba načtení JSON souboru")
+        self._save_time = metrics.histogram("bank_storage_save_seconds", "Doba atomického uložení JSON souboru")
         
     def load(self):
         """Načte data ze souboru. Pokud neexistuje, vrátí prázdný slovník."""
+        started = time.perf_counter()
+        try:
+            return self._load()
+        finally:
+            self._load_time.observe(time.perf_counter() - started)
+
+    def _load(self):
         with self.lock:
             if not os.path.exists(self.filename):
                 return {}
@@ -100,6 +464,13 @@ class ThreadSafeJsonStorage:
         Atomicky uloží data.
         Zapíše do .tmp a pak přejmenuje. Nikdy nezanechá poškozený soubor.
         """
+        started = time.perf_counter()
+        try:
+            self._save(data)
+        finally:
+            self._save_time.observe(time.perf_counter() - started)
+
+    def _save(self, data):
         with self.lock:
             # 1. Vytvoříme dočasný soubor ve stejném adresáři
             dir_name = os.path.dirname(self.filename) or '.'
@@ -109,6 +480,9 @@ class ThreadSafeJsonStorage:
                 # 2. Zapíšeme data
                 with os.fdopen(tmp_fd, 'w', encoding='utf-8') as tmp_file:
                     json.dump(data, tmp_file, indent=4)
+                    # Data musí být na disku dřív, než soubor přejmenujeme
+                    tmp_file.flush()
+                    os.fsync(tmp_file.fileno())
                 
                 # 3. Atomické přejmenování 
                 os.replace(tmp_path, self.filename)
@@ -118,4 +492,83 @@ class ThreadSafeJsonStorage:
                     os.remove(tmp_path)
                 raise e
 
-i18n = LocalizationManager()
\ No newline at end of file
+class JsonLinesFormatter(logging.Formatter):
+    """Formátuje záznam jako jeden JSON řádek (pro strojové zpracování logů)."""
+    EXTRA_FIELDS = ("ip", "cmd", "peer")
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for field in self.EXTRA_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Propustí jen každou N-tou zprávu (pro vysokoobjemové události typu RECV/SENT)."""
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        return next(self._counter) % self.rate == 0
+
+
+_log_listener = None
+
+def stop_logging():
+    """Dopíše frontu logů a zastaví zapisovací vlákno."""
+    global _log_listener
+    if _log_listener:
+        _log_listener.stop()
+        _log_listener = None
+
+def setup_logging(level="INFO", json_file=None, traffic_sample_rate=10,
+                  max_bytes=10 * 1024 * 1024, backup_count=5):
+    """
+    Nastaví logování aplikace (loggery "bank.*").
+    - Vlákna jen vloží záznam do fronty (QueueHandler), na konzoli/do souboru
+      zapisuje jediné vlákno na pozadí (QueueListener) - zápis neblokuje workery.
+    - Logger "bank.traffic" (zprávy RECV/SENT) je vzorkovaný: 1 z traffic_sample_rate.
+    - json_file: volitelný rotující soubor ve formátu JSON lines.
+    """
+    global _log_listener
+    stop_logging()
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s [%(name)s] %(message)s",
+                                           datefmt="%H:%M:%S"))
+    handlers = [console]
+    if json_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            json_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        file_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger("bank")
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    root.propagate = False
+
+    traffic = logging.getLogger("bank.traffic")
+    traffic.filters = [SamplingFilter(traffic_sample_rate)]
+
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _log_listener.start()
+    return _log_listener
+
+
+atexit.register(stop_logging)
+
+
+i18n = LocalizationManager()
@@ -0,0 +1,1371 @@
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import random
+import re
+import signal
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from contextlib import contextmanager
+from shared import ThreadSafeJsonStorage, metrics
+
+log = logging.getLogger("bank.storage")
+
+
+class WriteAheadLog:
+    """
+    Append-only log změn (Write-Ahead Log).
+    Každý záznam má hlavičku (délka + CRC32) a za ní JSON payload.
+    Po každém zápisu se volá fsync, takže potvrzená změna přežije pád.
+    """
+    HEADER = struct.Struct(">II")  # délka payloadu, crc32 payloadu
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = None
+        self._broken = None  # Chyba, po které se useknutý rámec nepodařilo odstranit
+        self.size = 0
+
+    def open(self):
+        """Otevře log pro připisování na konec (bez bufferu - co se zapíše, je v jádře)."""
+        self._file = open(self.filename, 'ab', buffering=0)
+        self.size = self._file.tell()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def append(self, record, sync=True):
+        """
+        Zapíše jeden záznam. Se sync=True počká, až bude fyzicky na disku,
+        jinak je jen předaný jádru (na disk ho dostane pozdější sync()).
+        """
+        if self._broken:
+            raise OSError(f"{self.filename}: log je po chybě zápisu nepoužitelný ({self._broken})")
+        payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        frame = memoryview(self.HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        try:
+            written = 0
+            while written < len(frame):
+                written += self._file.write(frame[written:])
+            if sync:
+                os.fsync(self._file.fileno())
+        except OSError:
+            self._discard_tail()
+            raise
+        self.size += len(frame)
+
+    def _discard_tail(self):
+        """
+        Po chybě zápisu zkrátí log na poslední celý záznam.
+        Jinak by další záznamy skončily za useknutým rámcem a replay() by je zahodil.
+        """
+        try:
+            os.ftruncate(self._file.fileno(), self.size)
+        except OSError as e:
+            log.critical("%s: nelze odstranit useknutý záznam: %s", self.filename, e)
+            self._broken = e
+
+    def sync(self):
+        """fsync všeho, co už bylo zapsané (volá se bez zámku zápisů)."""
+        os.fsync(self._file.fileno())
+
+    @classmethod
+    def replay(cls, filename):
+        """
+        Vrátí seznam platných záznamů z logu.
+        Useknutý nebo poškozený konec (pád uprostřed zápisu) se zahodí
+        a soubor se zkrátí na poslední platný záznam.
+        """
+        records = []
+        if not os.path.exists(filename):
+            return records
+
+        with open(filename, 'r+b') as f:
+            good_offset = 0
+            while True:
+                header = f.read(cls.HEADER.size)
+                if len(header) < cls.HEADER.size:
+                    break
+                length, crc = cls.HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                try:
+                    records.append(json.loads(payload.decode('utf-8')))
+                except ValueError:
+                    break
+                good_offset = f.tell()
+
+            # Úklid useknutého konce, aby se na něj nepřipisovalo
+            f.seek(0, os.SEEK_END)
+            if f.tell() != good_offset:
+                log.warning("%s: zahazuji poškozený konec logu.", filename)
+                f.truncate(good_offset)
+        return records
+
+
+class BinarySnapshot:
+    """
+    Binární snapshot účtů otevřený přes mmap (čte se bez načtení celého souboru).
+    Formát (big-endian):
+      hlavička: magic "BANKSNAP", verze (u16), rezerva (u16), počet záznamů (u64), crc32 záznamů (u32)
+      záznamy:  (číslo účtu u32, zůstatek i64) po 12 bajtech, seřazené podle čísla účtu
+    get() hledá půlením intervalu - O(log n) bez alokace celého slovníku.
+    """
+    MAGIC = b"BANKSNAP"
+    VERSION = 1
+    HEADER = struct.Struct(">8sHHQI")
+    RECORD = struct.Struct(">Iq")
+
+    def __init__(self, filename, verify=False):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Prázdný soubor nejde namapovat
+            self._file.close()
+            raise ValueError(f"{filename}: prázdný soubor")
+        magic, version, _, self.count, self.crc = self.HEADER.unpack_from(self._map, 0)
+        expected_size = self.HEADER.size + self.count * self.RECORD.size
+        if magic != self.MAGIC or version != self.VERSION or len(self._map) != expected_size:
+            self.close()
+            raise ValueError(f"{filename}: neplatný binární snapshot")
+        if verify and not self.verify():
+            self.close()
+            raise ValueError(f"{filename}: nesedí kontrolní součet")
+
+    def verify(self):
+        """Ověří crc32 všech záznamů (projde celý soubor)."""
+        return zlib.crc32(memoryview(self._map)[self.HEADER.size:]) == self.crc
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, index):
+        return self.RECORD.unpack_from(self._map, self.HEADER.size + index * self.RECORD.size)
+
+    def get(self, acc_num, default=None):
+        """Zůstatek účtu půlením intervalu (nebo default)."""
+        if not acc_num.isdigit() or str(int(acc_num)) != acc_num:
+            return default  # Nekanonické číslo v souboru být nemůže
+        key = int(acc_num)
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            number, balance = self._record(mid)
+            if number < key:
+                low = mid + 1
+            elif number > key:
+                high = mid
+            else:
+                return balance
+        return default
+
+    def items(self):
+        """Všechny záznamy jako (číslo účtu str, zůstatek) v pořadí čísel."""
+        records = memoryview(self._map)[self.HEADER.size:]
+        return ((str(number), balance) for number, balance in self.RECORD.iter_unpack(records))
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @classmethod
+    def encode(cls, data):
+        """
+        {cislo: zustatek} -> bajty snapshotu. Čísla účtů musí být kanonická
+        celá čísla 0..2^32-1 (bez úvodních nul), aby převod byl bezeztrátový.
+        """
+        # Převody po celých seznamech (map) - cyklus v Pythonu je u 1M účtů násobně pomalejší
+        keys = list(data)
+        try:
+            numbers = list(map(int, keys))
+        except ValueError as e:
+            raise ValueError(f"Číslo účtu nejde uložit binárně: {e}")
+        if list(map(str, numbers)) != keys or (numbers and not 0 <= min(numbers) <= max(numbers) < 2 ** 32):
+            raise ValueError("Čísla účtů musí být kanonická celá čísla 0..2^32-1")
+        # Big-endian záznamy se řadí jako bajty ve stejném pořadí jako čísla účtů
+        try:
+            body = b"".join(sorted(map(cls.RECORD.pack, numbers, data.values())))
+        except struct.error as e:
+            raise ValueError(f"Zůstatek nejde uložit jako int64: {e}")
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, 0, len(keys), zlib.crc32(body))
+        return header + body
+
+
+class BinarySnapshotStorage:
+    """
+    Stejné rozhraní jako ThreadSafeJsonStorage (load/save), ale v binárním
+    formátu BinarySnapshot: menší soubor a rychlejší načtení i uložení.
+    Ukládá se atomicky (dočasný soubor + fsync + přejmenování).
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.RLock()
+        self._load_time = metrics.histogram("bank_binary_snapshot_load_seconds", "Doba načtení binárního snapshotu")
+        self._save_time = metrics.histogram("bank_binary_snapshot_save_seconds", "Doba uložení binárního snapshotu")
+
+    def load(self):
+        """Načte všechny účty; chybí-li soubor, vrátí prázdný slovník. Poškozený soubor = ValueError."""
+        started = time.perf_counter()
+        with self.lock:
+            if not os.path.exists(self.filename) or not os.path.getsize(self.filename):
+                return {}
+            with BinarySnapshot(self.filename, verify=True) as snapshot:
+                data = dict(snapshot.items())
+        self._load_time.observe(time.perf_counter() - started)
+        return data
+
+    def save(self, data):
+        started = time.perf_counter()
+        payload = BinarySnapshot.encode(data)
+        with self.lock:
+            dir_name = os.path.dirname(self.filename) or '.'
+            tmp_fd, tmp_path = tempfile.mkstemp(dir=dir_name)
+            try:
+                with os.fdopen(tmp_fd, 'wb') as tmp_file:
+                    tmp_file.write(payload)
+                    tmp_file.flush()
+                    os.fsync(tmp_file.fileno())
+                os.replace(tmp_path, self.filename)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        self._save_time.observe(time.perf_counter() - started)
+
+
+BINARY_SNAPSHOT_SUFFIX = ".bin"
+
+
+def snapshot_storage_for(filename):
+    """Úložiště snapshotu podle přípony: *.bin = binární formát, jinak JSON."""
+    if filename.endswith(BINARY_SNAPSHOT_SUFFIX):
+        return BinarySnapshotStorage(filename)
+    return ThreadSafeJsonStorage(filename)
+
+
+class AccountTransaction:
+    """
+    Pohled na jeden účet uvnitř transakce (viz LedgerStorage.account).
+    Neexistující účet má balance = None.
+    """
+    def __init__(self, acc_num, balance):
+        self.acc_num = acc_num
+        self.original_balance = balance
+        self.balance = balance
+
+    @property
+    def exists(self):
+        return self.balance is not None
+
+    @property
+    def changed(self):
+        return self.balance != self.original_balance
+
+    def create(self, balance=0):
+        """Založí účet (změna se projeví až po úspěšném konci transakce)."""
+        self.balance = balance
+
+    def delete(self):
+        """Smaže účet (změna se projeví až po úspěšném konci transakce)."""
+        self.balance = None
+
+
+class AccountAllocator:
+    """
+    Přidělování čísel nových účtů bez kolizí, O(1) na jedno číslo.
+    Čísla low, low+step, ..., <= high prochází v náhodném pořadí pomocí LCG
+    s plnou periodou (x -> (a*x + c) mod 2^k, hodnoty mimo rozsah se přeskočí),
+    takže každé číslo navštíví právě jednou. Obsazená čísla drží bitmapa
+    (bytearray), čísla uvolněná přes AR jdou do free-listu a přidělí se znovu.
+
+    Trvale se ukládá jen stav generátoru (state(): pár čísel); bitmapa
+    se při startu postaví z existujících účtů a free-list přehráním LCG.
+    """
+    def __init__(self, low=10000, high=99999, step=1, state=None):
+        self.low = low
+        self.step = step
+        self.size = (high - low) // step + 1
+        self._modulus = 1 << max(2, (self.size - 1).bit_length())
+        state = state or {}
+        if state.get("size") != self.size or state.get("low") != low:
+            state = {}  # Jiný rozsah -> nová permutace
+        rng = random.Random()
+        self._a = state.get("a", rng.randrange(self._modulus // 4) * 4 + 1)  # a ≡ 1 (mod 4)
+        self._c = state.get("c", rng.randrange(self._modulus // 2) * 2 + 1)  # c liché
+        self._seed = state.get("seed", rng.randrange(self._modulus))
+        self._restored_steps = state.get("steps", 0)
+        self._x = self._seed
+        self._steps = 0
+        self._used = bytearray(self.size)
+        self._free = []
+        self._lock = threading.Lock()
+
+    def _index(self, acc_num):
+        """Číslo účtu -> index v bitmapě (None, pokud do rozsahu nepatří)."""
+        if not acc_num.isdigit():
+            return None
+        offset = int(acc_num) - self.low
+        if offset < 0 or offset % self.step:
+            return None
+        index = offset // self.step
+        return index if index < self.size else None
+
+    def _next_index(self):
+        """Další index permutace, None po projití celé periody."""
+        while self._steps < self._modulus:
+            self._x = (self._a * self._x + self._c) % self._modulus
+            self._steps += 1
+            if self._x < self.size:
+                return self._x
+        return None
+
+    def load(self, acc_nums):
+        """Označí existující účty a obnoví free-list (navštívená, ale volná čísla)."""
+        with self._lock:
+            for acc_num in acc_nums:
+                index = self._index(acc_num)
+                if index is not None:
+                    self._used[index] = 1
+            while self._steps < self._restored_steps:
+                index = self._next_index()
+                if index is not None and not self._used[index]:
+                    self._free.append(index)
+
+    def allocate(self):
+        """Rezervuje a vrátí volné číslo účtu, nebo None, když je rozsah vyčerpaný."""
+        with self._lock:
+            while self._free:
+                index = self._free.pop()
+                if not self._used[index]:
+                    break
+            else:
+                index = self._next_index()
+                while index is not None and self._used[index]:
+                    index = self._next_index()
+                if index is None:
+                    return None
+            self._used[index] = 1
+            return str(self.low + index * self.step)
+
+    def mark_used(self, acc_num):
+        index = self._index(acc_num)
+        if index is not None:
+            self._used[index] = 1
+
+    def release(self, acc_num):
+        """Vrátí číslo smazaného účtu k dalšímu použití."""
+        index = self._index(acc_num)
+        if index is None:
+            return
+        with self._lock:
+            if self._used[index]:
+                self._used[index] = 0
+                self._free.append(index)
+
+    def state(self):
+        return {"low": self.low, "size": self.size, "a": self._a, "c": self._c,
+                "seed": self._seed, "steps": self._steps}
+
+
+class AccountStorage:
+    """
+    Společné rozhraní úložišť účtů (LedgerStorage, ShardedStorage, SqliteStorage).
+    BankController používá jen tyto metody, konkrétní engine vybírá open_storage.
+    Čísla účtů jsou řetězce, zůstatky celá čísla.
+    """
+    def get(self, acc_num, default=None):
+        """Vrátí zůstatek účtu (nebo default, pokud účet neexistuje)."""
+        raise NotImplementedError
+
+    def __contains__(self, acc_num):
+        return self.get(acc_num) is not None
+
+    def snapshot(self):
+        """Vrátí konzistentní kopii všech účtů {cislo: zustatek}."""
+        raise NotImplementedError
+
+    def totals(self):
+        """Vrátí (součet zůstatků, počet účtů) - pro BA/BN, bez procházení účtů."""
+        raise NotImplementedError
+
+    allocator = None  # AccountAllocator, pokud úložiště přiděluje čísla účtů
+
+    def allocate_account_number(self):
+        """Rezervuje volné číslo nového účtu (None = rozsah čísel je vyčerpaný)."""
+        return self.allocator.allocate()
+
+    def account(self, acc_num):
+        """Context manager: atomická transakce nad jedním účtem (AccountTransaction)."""
+        raise NotImplementedError
+
+    def accounts(self, acc_nums):
+        """Context manager: atomická transakce nad více účty {cislo: AccountTransaction}."""
+        raise NotImplementedError
+
+    def compact(self):
+        """Údržba na pozadí (kompakce logu, checkpoint). Výchozí: nic."""
+
+    def close(self):
+        """Uloží vše potřebné a uvolní soubory."""
+
+
+class LedgerStorage(AccountStorage):
+    """
+    Úložiště účtů držené v paměti.
+    1. Všechny účty jsou v RAM, čtení nesahá na disk.
+    2. Každá změna se nejdřív zapíše do write-ahead logu (O(1) I/O).
+    3. Na pozadí se log pravidelně kompaktuje do nového snapshotu
+       (data.json, nebo binární data.bin - viz snapshot_storage_for).
+    Po startu se načte poslední snapshot a přehraje se přes něj log.
+
+    Souběh řeší transakce nad jedním účtem (with storage.account(cislo) as acct).
+    Účty jsou rozdělené do skupin (stripes) s vlastním zámkem, takže operace
+    nad různými účty běží paralelně a nad stejným účtem jedna po druhé.
+
+    Součet zůstatků a počet účtů se udržuje průběžně (BA/BN v O(1)).
+
+    Trvanlivost zápisů (durability):
+    - "strict": každý commit má vlastní fsync (pod zámkem logu),
+    - "group": group commit - commity se jen zapíšou do logu a vlákno
+      committer je dostane na disk jedním fsync za celou dávku; transakce
+      skončí (klient dostane odpověď) až po fsync své dávky. Na rozpracované
+      transakce committer počká nejvýš group_delay sekund,
+    - "relaxed": odpověď hned po zápisu do logu, fsync nejpozději
+      po group_delay (při pádu OS lze přijít o poslední milisekundy).
+    Změna je v paměti vidět už před fsync (zámek účtu se uvolní dřív,
+    na trvanlivost se čeká mimo něj), jen odpověď se pošle až po něm.
+    """
+    DURABILITY_MODES = ("strict", "group", "relaxed")
+
+    # Typy záznamů v logu
+    OP_SET = "S"     # ["S", cislo_uctu, zustatek]
+    OP_DELETE = "D"  # ["D", cislo_uctu]
+    OP_BATCH = "B"   # ["B", [zaznam, zaznam, ...]] - více změn atomicky
+
+    def __init__(self, filename, compact_interval=30.0, lock_stripes=64, allocate=True,
+                 durability="strict", group_delay=0.002):
+        if durability not in self.DURABILITY_MODES:
+            raise ValueError(f"Neznámý režim durability: {durability}")
+        self.filename = filename
+        self.log_filename = filename + ".wal"
+        self.old_log_filename = self.log_filename + ".old"
+        self.compact_interval = compact_interval
+
+        self.snapshot_storage = snapshot_storage_for(filename)
+        self._log_lock = threading.RLock()     # Serializuje zápisy do logu
+        self._stripes = [threading.Lock() for _ in range(lock_stripes)]
+        self._compact_lock = threading.Lock()  # Jen jedna kompakce naráz
+        self._accounts = {}
+        self._totals = (0, 0)  # (součet zůstatků, počet účtů) - měněno jediným přiřazením
+        self._log = WriteAheadLog(self.log_filename)
+        self._append_time = metrics.histogram("bank_wal_append_seconds", "Zápis (+ fsync ve strict) záznamu do WAL")
+        self._compact_time = metrics.histogram("bank_wal_compact_seconds", "Doba kompakce WAL do snapshotu")
+
+        # Group commit: _lsn = pořadí posledního zapsaného záznamu, _durable_lsn = posledního po fsync
+        self.durability = durability
+        self.group_delay = group_delay
+        self._lsn = 0
+        self._durable_lsn = 0
+        self._in_flight = 0                   # Transakce, které ještě mohou zapsat do dávky
+        self._sync_cond = threading.Condition(threading.Lock())
+        self._sync_lock = threading.Lock()    # fsync vs. výměna souboru logu při kompakci
+        self._sync_error = None
+        self._closing = False
+        self._fsync_time = metrics.histogram("bank_wal_fsync_seconds", "Doba fsync jedné dávky WAL")
+        self._fsyncs = metrics.counter("bank_wal_fsyncs_total", "Počet fsync WAL")
+        self._records = metrics.counter("bank_wal_records_total", "Počet záznamů zapsaných do WAL")
+
+        self._recover()
+        self._log.open()
+
+        # Přidělování čísel AC (stav generátoru v data.json.alloc)
+        self.allocator = None
+        if allocate:
+            self._allocator_storage = ThreadSafeJsonStorage(filename + ".alloc")
+            self.allocator = AccountAllocator(state=self._allocator_storage.load())
+            self.allocator.load(self._accounts)
+
+        self._stop_event = threading.Event()
+        self._compactor = threading.Thread(target=self._compact_loop, daemon=True)
+        self._compactor.start()
+
+        self._committer = None
+        if durability != "strict":
+            self._committer = threading.Thread(target=self._group_commit_loop,
+                                               name="wal-committer", daemon=True)
+            self._committer.start()
+
+    # --- OBNOVA PO STARTU ---
+
+    def _recover(self):
+        """Načte snapshot a přehraje přes něj logy (nejdřív starší, pak aktuální)."""
+        self.allocator = None  # Vznikne až po obnově z existujících účtů
+        self._accounts = self.snapshot_storage.load()
+        self._totals = self._recompute_totals()
+
+        replayed = 0
+        for log_file in (self.old_log_filename, self.log_filename):
+            for record in WriteAheadLog.replay(log_file):
+                self._apply(record)
+                replayed += 1
+
+        self._verify_totals()
+
+        if replayed or os.path.exists(self.old_log_filename):
+            # Obnovený stav uložíme jako nový snapshot a přehrané logy smažeme
+            log.info("Obnoveno %d změn z logu, ukládám nový snapshot.", replayed)
+            self.snapshot_storage.save(dict(self._accounts))
+            for log_file in (self.old_log_filename, self.log_filename):
+                if os.path.exists(log_file):
+                    os.remove(log_file)
+
+    def _apply(self, record):
+        """Aplikuje jeden záznam logu na data v paměti a upraví průběžné součty."""
+        if record[0] == self.OP_BATCH:
+            totals = self._totals
+            for sub_record in record[1]:
+                totals = self._apply_change(sub_record, totals)
+        else:
+            totals = self._apply_change(record, self._totals)
+        # Součty se publikují jednou i pro celou dávku
+        self._totals = totals
+
+    def _apply_change(self, record, totals):
+        """Aplikuje změnu jednoho účtu, vrátí nové (součet, počet)."""
+        op, acc_num = record[0], record[1]
+        total, count = totals
+        old_balance = self._accounts.get(acc_num)
+
+        if op == self.OP_SET:
+            self._accounts[acc_num] = record[2]
+            total += record[2] - (old_balance or 0)
+            if old_balance is None:
+                count += 1
+                if self.allocator:
+                    self.allocator.mark_used(acc_num)
+        elif op == self.OP_DELETE and old_balance is not None:
+            del self._accounts[acc_num]
+            total -= old_balance
+            count -= 1
+            if self.allocator:
+                self.allocator.release(acc_num)
+
+        return (total, count)
+
+    def _recompute_totals(self):
+        return (sum(self._accounts.values()), len(self._accounts))
+
+    def _verify_totals(self):
+        """Porovná průběžné součty s plným přepočtem (při startu)."""
+        expected = self._recompute_totals()
+        if self._totals != expected:
+            log.warning("Nesedí průběžné součty %s != %s, opravuji.", self._totals, expected)
+            self._totals = expected
+
+    # --- ČTENÍ ---
+
+    def get(self, acc_num, default=None):
+        """Vrátí zůstatek účtu (nebo default, pokud účet neexistuje)."""
+        return self._accounts.get(acc_num, default)
+
+    def __contains__(self, acc_num):
+        return acc_num in self._accounts
+
+    def snapshot(self):
+        """
+        Vrátí konzistentní kopii všech účtů {cislo: zustatek}.
+        Nečeká na zámky: každý commit je jediná změna slovníku,
+        takže kopie vidí každý účet buď před, nebo po transakci.
+        """
+        return self._accounts.copy()
+
+    def totals(self):
+        """Vrátí (součet zůstatků, počet účtů) bez přístupu k souboru."""
+        return self._totals
+
+    # --- TRANSAKCE ---
+
+    def _stripe_lock(self, acc_num):
+        return self._stripes[hash(acc_num) % len(self._stripes)]
+
+    @contextmanager
+    def account(self, acc_num):
+        """
+        Atomická read-modify-write transakce nad jedním účtem.
+        Změny se zapíšou do logu až při úspěšném opuštění bloku,
+        výjimka uvnitř bloku transakci zahodí.
+        """
+        lsn = None
+        self._begin()
+        try:
+            with self._stripe_lock(acc_num):
+                txn = AccountTransaction(acc_num, self._accounts.get(acc_num))
+                yield txn
+                if txn.changed:
+                    lsn = self._commit(txn)
+        finally:
+            self._end()
+        if lsn:
+            self._wait_durable(lsn)
+
+    @contextmanager
+    def accounts(self, acc_nums):
+        """
+        Atomická transakce nad více účty (např. dávka AX).
+        Vrací {cislo: AccountTransaction}. Všechny změny jdou do logu
+        jediným záznamem (jeden fsync) - buď se zapíšou všechny, nebo žádná.
+        """
+        # Zámky bereme vždy ve stejném pořadí, aby nevznikl deadlock
+        stripes = sorted({hash(acc_num) % len(self._stripes) for acc_num in acc_nums})
+        lsn = None
+        self._begin()
+        for index in stripes:
+            self._stripes[index].acquire()
+        try:
+            txns = {acc_num: AccountTransaction(acc_num, self._accounts.get(acc_num))
+                    for acc_num in acc_nums}
+            yield txns
+            changed = [txn for txn in txns.values() if txn.changed]
+            if len(changed) == 1:
+                lsn = self._commit(changed[0])
+            elif changed:
+                lsn = self._write([self.OP_BATCH, [self._record(txn) for txn in changed]])
+        finally:
+            for index in reversed(stripes):
+                self._stripes[index].release()
+            self._end()
+        if lsn:
+            self._wait_durable(lsn)
+
+    def _record(self, txn):
+        if txn.exists:
+            return [self.OP_SET, txn.acc_num, txn.balance]
+        return [self.OP_DELETE, txn.acc_num]
+
+    def _commit(self, txn):
+        return self._write(self._record(txn))
+
+    def _write(self, record):
+        """
+        Zapíše změnu do logu (write-ahead) a teprve pak ji promítne do paměti.
+        Vrací LSN záznamu, na jehož fsync se má počkat (None = už je na disku).
+        """
+        strict = self.durability == "strict"
+        with self._log_lock:
+            started = time.perf_counter()
+            self._log.append(record, sync=strict)
+            self._append_time.observe(time.perf_counter() - started)
+            self._apply(record)
+            self._records.inc()
+            if strict:
+                self._fsyncs.inc()
+                return None
+            with self._sync_cond:
+                self._lsn += 1
+                self._sync_cond.notify_all()
+                return self._lsn if self.durability == "group" else None
+
+    # --- GROUP COMMIT ---
+
+    def _begin(self):
+        if self._committer:
+            with self._sync_cond:
+                self._in_flight += 1
+
+    def _end(self):
+        if self._committer:
+            with self._sync_cond:
+                self._in_flight -= 1
+                if not self._in_flight:
+                    self._sync_cond.notify_all()
+
+    def _wait_durable(self, lsn):
+        """Počká, až committer dostane záznam lsn na disk."""
+        with self._sync_cond:
+            while self._durable_lsn < lsn and not self._sync_error:
+                self._sync_cond.wait()
+            if self._durable_lsn < lsn:
+                raise RuntimeError(f"Zápis do WAL selhal: {self._sync_error}")
+
+    def _group_commit_loop(self):
+        """
+        Vlákno committer: čeká na nezapsané záznamy, nechá doběhnout
+        rozpracované transakce (max. group_delay) a pak udělá jeden fsync pro všechny.
+        """
+        while True:
+            with self._sync_cond:
+                while self._lsn == self._durable_lsn and not self._closing:
+                    self._sync_cond.wait()
+                if self._lsn == self._durable_lsn:
+                    return  # Zavírání a vše je na disku
+                deadline = time.monotonic() + self.group_delay
+                while not self._closing:
+                    remaining = deadline - time.monotonic()
+                    # V režimu group se nečeká, když už nikdo další nezapisuje
+                    if remaining <= 0 or (self.durability == "group" and not self._in_flight):
+                        break
+                    self._sync_cond.wait(remaining)
+            self._sync()
+
+    def _sync(self):
+        """fsync všeho zapsaného (mimo zámek logu, zápisy mezitím běží dál)."""
+        with self._sync_lock:
+            with self._log_lock:
+                target = self._lsn
+            started = time.perf_counter()
+            try:
+                self._log.sync()
+            except OSError as e:
+                log.critical("fsync WAL selhal: %s", e)
+                with self._sync_cond:
+                    self._sync_error = e
+                    self._sync_cond.notify_all()
+                return
+            self._fsync_time.observe(time.perf_counter() - started)
+            self._fsyncs.inc()
+            self._mark_durable(target)
+
+    def _mark_durable(self, lsn):
+        with self._sync_cond:
+            if lsn > self._durable_lsn:
+                self._durable_lsn = lsn
+                self._sync_cond.notify_all()
+
+    # --- KOMPAKCE ---
+
+    def compact(self):
+        """
+        Přepíše log do nového snapshotu.
+        Zápisy jsou blokované jen po dobu výměny souboru logu,
+        samotný (pomalý) zápis snapshotu běží mimo zámek.
+        """
+        with self._compact_lock:
+            started = time.perf_counter()
+            # _sync_lock jen na výměnu souboru (committer nesmí fsyncovat zavřený log);
+            # při ukládání snapshotu už group commit běží dál
+            with self._sync_lock, self._log_lock:
+                # Starý log zbyl po neúspěšném uložení snapshotu - jeho záznamy ještě
+                # nejsou v žádném snapshotu, takže ho nesmíme přepsat dalším logem
+                pending_old = os.path.exists(self.old_log_filename)
+                if self._log.size == 0 and not pending_old:
+                    return
+                data = dict(self._accounts)
+                if self._committer:
+                    # Nezapsaná dávka group commitu musí na disk dřív, než log zavřeme
+                    self._log.sync()
+                    self._mark_durable(self._lsn)
+                if not pending_old:
+                    self._log.close()
+                    os.replace(self.log_filename, self.old_log_filename)
+                    self._log.open()
+
+            # Snapshot obsahuje vše ze starého logu -> starý log můžeme smazat.
+            # Bez výměny zůstane aktuální log celý; jeho záznamy nastavují absolutní
+            # zůstatky, takže je jde po startu přehrát i přes snapshot, který už je obsahuje.
+            self.snapshot_storage.save(data)
+            os.remove(self.old_log_filename)
+            if self.allocator:
+                self._allocator_storage.save(self.allocator.state())
+            self._compact_time.observe(time.perf_counter() - started)
+
+    def _compact_loop(self):
+        while not self._stop_event.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception as e:
+                log.error("Kompakce selhala: %s", e)
+
+    def close(self):
+        """Zastaví kompakci i committer, uloží finální snapshot a zavře log."""
+        self._stop_event.set()
+        if self._committer:
+            with self._sync_cond:
+                self._closing = True
+                self._sync_cond.notify_all()
+            self._committer.join()
+        self.compact()
+        with self._log_lock:
+            self._log.close()
+
+
+# --- SHARDOVANÉ ÚLOŽIŠTĚ (více procesů) ---
+
+def _shard_commit(storage, changes):
+    """Zapíše změny {cislo: zustatek | None} jedné shardy jedním záznamem."""
+    with storage.accounts(list(changes)) as txns:
+        for acc_num, balance in changes.items():
+            txns[acc_num].balance = balance
+
+
+def _shard_worker(conn, filename, compact_interval, durability="strict"):
+    """
+    Hlavní smyčka procesu jedné shardy: vlastní LedgerStorage (soubor + WAL)
+    a odpovídá na požadavky z roury ve tvaru (operace, *argumenty).
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C řeší hlavní proces
+    storage = LedgerStorage(filename, compact_interval, allocate=False,  # Čísla přiděluje hlavní proces
+                            durability=durability)
+    handlers = {
+        "get": lambda acc_nums: [storage.get(acc_num) for acc_num in acc_nums],
+        "commit": lambda changes: _shard_commit(storage, changes),
+        "totals": storage.totals,
+        "snapshot": storage.snapshot,
+        "numbers": lambda: list(storage.snapshot()),
+        "compact": storage.compact,
+    }
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break  # Hlavní proces skončil
+        if request[0] == "close":
+            storage.close()
+            conn.send(("ok", None))
+            return
+        try:
+            conn.send(("ok", handlers[request[0]](*request[1:])))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+    storage.close()
+
+
+def shard_files(filename, shards):
+    return [f"{filename}.shard-{i}-of-{shards}" for i in range(shards)]
+
+
+def _shard_layouts(filename):
+    """Existující rozložení shard na disku: {počet shard: [soubory]}."""
+    directory = os.path.dirname(filename) or "."
+    pattern = re.compile(re.escape(os.path.basename(filename)) + r"\.shard-(\d+)-of-(\d+)$")
+    layouts = {}
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match:
+            layouts.setdefault(int(match.group(2)), set()).add(int(match.group(1)))
+    return {count: shard_files(filename, count) for count in layouts}
+
+
+def _read_ledger(filename):
+    """Stav úložiště ledger ze souboru (snapshot + přehraný WAL)."""
+    storage = LedgerStorage(filename, compact_interval=3600, allocate=False)
+    data = storage.snapshot()
+    storage.close()
+    return data
+
+
+def _retire(filename):
+    """Odloží soubor dat (a neprázdný WAL) jako *.retired-<čas> - data se nemažou."""
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    for path in (filename, filename + ".wal"):
+        if not os.path.exists(path):
+            continue
+        if path != filename and os.path.getsize(path) == 0:
+            os.remove(path)
+            continue
+        target = f"{path}.retired-{stamp}"
+        suffix = 1
+        while os.path.exists(target):
+            target = f"{path}.retired-{stamp}.{suffix}"
+            suffix += 1
+        os.replace(path, target)
+
+
+def prepare_ledger_files(filename, shards):
+    """
+    Sjednotí soubory úložiště ledger na disku s konfigurací (shards <= 1 = jeden
+    soubor filename, jinak filename.shard-I-of-N), než se úložiště otevře:
+    - data v jiném rozložení (nešardovaný data.json, jiný počet shard) se
+      přerozdělí do požadovaného a původní soubory se odloží jako *.retired-<čas>,
+    - když požadované rozložení už existuje a vedle něj i jiné, jsou jiná
+      data jen zbytek z dřívějšího přerozdělení -> odloží se s varováním,
+    - více různých starých rozložení najednou = nejednoznačné, start se odmítne.
+    Při změně rozložení se zahodí uložený stav alokátoru (filename.alloc).
+    """
+    targets = shard_files(filename, shards) if shards > 1 else [filename]
+    target_name = f"{filename}.shard-*-of-{shards}" if shards > 1 else filename
+    # Ostatní rozložení: (popis, soubory)
+    sources = [(f"{filename}.shard-*-of-{count}", files)
+               for count, files in sorted(_shard_layouts(filename).items()) if count != shards]
+    if shards > 1 and os.path.exists(filename):
+        sources.append((filename, [filename]))
+
+    if any(os.path.exists(path) for path in targets):
+        for name, files in sources:
+            log.warning("Odkládám neaktuální data %s (úložiště používá %s).", name, target_name)
+            for path in files:
+                _retire(path)
+        return
+
+    if not sources:
+        return
+    if len(sources) > 1:
+        raise RuntimeError("Nejednoznačná data úložiště (" +
+                           ", ".join(name for name, _ in sources) +
+                           ") - ponechte jen jedno rozložení.")
+
+    source_name, source_files = sources[0]
+    data = {}
+    for path in source_files:
+        data.update(_read_ledger(path))
+    if shards > 1:
+        parts = [{} for _ in targets]
+        for acc_num, balance in data.items():
+            parts[_shard_index(acc_num, shards)][acc_num] = balance
+        for path, part in zip(targets, parts):
+            ThreadSafeJsonStorage(path).save(part)
+    else:
+        snapshot_storage_for(filename).save(data)
+    for path in source_files:
+        _retire(path)
+    if os.path.exists(filename + ".alloc"):
+        os.remove(filename + ".alloc")  # Alokátory vzniknou znovu z čísel účtů
+    log.info("Přerozděleno %d účtů z %s do %s.", len(data), source_name, target_name)
+
+
+def _shard_index(acc_num, shards):
+    if acc_num.isdigit():
+        return int(acc_num) % shards
+    return zlib.crc32(acc_num.encode('utf-8')) % shards
+
+
+class ShardedStorage(AccountStorage):
+    """
+    Úložiště rozdělené podle čísla účtu (cislo % shards) mezi více procesů.
+    Každý proces drží svou shardu jako LedgerStorage s vlastním souborem
+    (data.json.shard-0-of-4 ...), takže zápisy do WAL a kompakce běží
+    na více jádrech. Tento (hlavní) proces jen směruje požadavky rourou.
+
+    Rozhraní je stejné jako u LedgerStorage. Transakce drží zámky (stripes)
+    zde v hlavním procesu - všechny zápisy jdou přes něj, takže stačí.
+    Transakce přes více shard je atomická vůči souběžným operacím,
+    ale na disk se zapisuje po shardách (po pádu může být zapsaná jen část).
+    """
+    def __init__(self, filename, shards=4, compact_interval=30.0, lock_stripes=64,
+                 durability="strict"):
+        self.filename = filename
+        self.shards = shards
+        self._stripes = [threading.Lock() for _ in range(lock_stripes)]
+        self._counts = [0] * shards  # Počty účtů po shardách (pro rozkládání AC)
+        self._counts_lock = threading.Lock()
+        self._allocator_storage = ThreadSafeJsonStorage(filename + ".alloc")
+
+        # Nešardovaný data.json nebo jiný počet shard -> přerozdělit
+        prepare_ledger_files(filename, shards)
+        files = shard_files(filename, shards)
+
+        context = multiprocessing.get_context("spawn")
+        self._pipes = []
+        self._pipe_locks = [threading.Lock() for _ in range(shards)]
+        self._processes = []
+        for shard_file in files:
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_shard_worker, name="bank-shard",
+                                      args=(child_conn, shard_file, compact_interval, durability),
+                                      daemon=True)
+            process.start()
+            child_conn.close()
+            self._pipes.append(parent_conn)
+            self._processes.append(process)
+
+        for shard, (_, count) in enumerate(self._gather("totals")):
+            self._counts[shard] = count
+
+        # Každá sharda má vlastní alokátor nad čísly, která do ní patří (cislo % shards)
+        states = self._allocator_storage.load().get("shards", [])
+        self._allocators = []
+        for shard, acc_nums in enumerate(self._gather("numbers")):
+            low = 10000 + (shard - 10000) % shards
+            allocator = AccountAllocator(low, 99999, shards,
+                                         states[shard] if shard < len(states) else None)
+            allocator.load(acc_nums)
+            self._allocators.append(allocator)
+        log.info("Shardované úložiště: %d procesů, %d účtů.", shards, sum(self._counts))
+
+    # --- KOMUNIKACE SE SHARDAMI ---
+
+    def shard_of(self, acc_num):
+        return _shard_index(acc_num, self.shards)
+
+    def _call(self, shard, *request):
+        """Pošle požadavek jedné shardě a počká na odpověď."""
+        with self._pipe_locks[shard]:
+            conn = self._pipes[shard]
+            conn.send(request)
+            status, value = conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Shard {shard}: {value}")
+        return value
+
+    def _gather(self, *request):
+        """
+        Pošle stejný požadavek všem shardám naráz a posbírá odpovědi
+        (shardy pracují paralelně, čeká se jen na tu nejpomalejší).
+        """
+        for lock in self._pipe_locks:
+            lock.acquire()
+        try:
+            for conn in self._pipes:
+                conn.send(request)
+            replies = [conn.recv() for conn in self._pipes]
+        finally:
+            for lock in reversed(self._pipe_locks):
+                lock.release()
+        for shard, (status, value) in enumerate(replies):
+            if status != "ok":
+                raise RuntimeError(f"Shard {shard}: {value}")
+        return [value for _, value in replies]
+
+    # --- ČTENÍ ---
+
+    def get(self, acc_num, default=None):
+        balance = self._call(self.shard_of(acc_num), "get", [acc_num])[0]
+        return default if balance is None else balance
+
+    def snapshot(self):
+        data = {}
+        for part in self._gather("snapshot"):
+            data.update(part)
+        return data
+
+    def totals(self):
+        total = count = 0
+        for shard_total, shard_count in self._gather("totals"):
+            total += shard_total
+            count += shard_count
+        return (total, count)
+
+    def allocate_account_number(self):
+        """Číslo nového účtu z nejméně zaplněné shardy (rozkládá zátěž)."""
+        with self._counts_lock:
+            order = sorted(range(self.shards), key=self._counts.__getitem__)
+        for shard in order:
+            acc_num = self._allocators[shard].allocate()
+            if acc_num is not None:
+                return acc_num
+        return None
+
+    # --- TRANSAKCE ---
+
+    def _stripe_lock(self, acc_num):
+        return self._stripes[hash(acc_num) % len(self._stripes)]
+
+    @contextmanager
+    def account(self, acc_num):
+        """Jako LedgerStorage.account - čtení a zápis jdou do shardy účtu."""
+        with self._stripe_lock(acc_num):
+            txn = AccountTransaction(acc_num, self.get(acc_num))
+            yield txn
+            if txn.changed:
+                self._commit([txn])
+
+    @contextmanager
+    def accounts(self, acc_nums):
+        """Jako LedgerStorage.accounts - čte jedním požadavkem na každou shardu."""
+        acc_nums = list(acc_nums)
+        stripes = sorted({hash(acc_num) % len(self._stripes) for acc_num in acc_nums})
+        for index in stripes:
+            self._stripes[index].acquire()
+        try:
+            by_shard = {}
+            for acc_num in acc_nums:
+                by_shard.setdefault(self.shard_of(acc_num), []).append(acc_num)
+            txns = {}
+            for shard, shard_accs in by_shard.items():
+                for acc_num, balance in zip(shard_accs, self._call(shard, "get", shard_accs)):
+                    txns[acc_num] = AccountTransaction(acc_num, balance)
+            yield txns
+            self._commit([txn for txn in txns.values() if txn.changed])
+        finally:
+            for index in reversed(stripes):
+                self._stripes[index].release()
+
+    def _commit(self, txns):
+        """Pošle změny do shard (každé shardě jeden záznam) a upraví počty účtů."""
+        by_shard = {}
+        for txn in txns:
+            by_shard.setdefault(self.shard_of(txn.acc_num), {})[txn.acc_num] = txn.balance
+        for shard, changes in by_shard.items():
+            self._call(shard, "commit", changes)
+
+        with self._counts_lock:
+            for txn in txns:
+                if txn.exists != (txn.original_balance is not None):
+                    shard = self.shard_of(txn.acc_num)
+                    self._counts[shard] += 1 if txn.exists else -1
+                    if txn.exists:
+                        self._allocators[shard].mark_used(txn.acc_num)
+                    else:
+                        self._allocators[shard].release(txn.acc_num)
+
+    # --- KOMPAKCE A UKONČENÍ ---
+
+    def compact(self):
+        self._gather("compact")
+        self._save_allocators()
+
+    def _save_allocators(self):
+        self._allocator_storage.save({"shards": [a.state() for a in self._allocators]})
+
+    def close(self):
+        """Požádá shardy o finální snapshot a počká na jejich ukončení."""
+        self._save_allocators()
+        try:
+            self._gather("close")
+        except (OSError, EOFError, RuntimeError) as e:
+            log.warning("Ukončení shard: %s", e)
+        for process in self._processes:
+            process.join(timeout=10)
+
+
+# --- SQLITE ---
+
+class _ThreadConnection:
+    """Obal spojení v thread-local (na obyčejné sqlite3.Connection nejde weakref.finalize)."""
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+class SqliteStorage(AccountStorage):
+    """
+    Úložiště účtů v SQLite (alternativa k JSON snapshotu + WAL).
+    - Tabulka accounts s primárním klíčem číslo účtu -> bodové operace O(log n).
+    - Journal v režimu WAL, synchronous=FULL: potvrzený commit přežije pád
+      (durability="relaxed" -> synchronous=NORMAL: fsync až při checkpointu,
+      pád OS může vzít poslední commity, databáze ale zůstane konzistentní).
+    - Každé vlákno má vlastní spojení; sqlite3 si připravené příkazy
+      drží v cache spojení (stejný text SQL = jednou připravený statement).
+    - Transakce nad účtem = BEGIN IMMEDIATE ... COMMIT (zápisový zámek hned
+      na začátku, takže read-modify-write nemůže kolidovat).
+    - Součet a počet účtů udržují triggery v tabulce totals (BA/BN v O(1)).
+    - Každých compact_interval sekund (a při close) se uloží stav alokátoru
+      čísel AC a WAL SQLite se přenese do hlavního souboru (compact).
+    Stávající data.json převede nástroj migrate.py.
+    """
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS accounts ("
+        " number TEXT PRIMARY KEY, balance INTEGER NOT NULL) WITHOUT ROWID",
+        "CREATE TABLE IF NOT EXISTS totals ("
+        " id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL, count INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO totals (id, total, count)"
+        " SELECT 0, COALESCE(SUM(balance), 0), COUNT(*) FROM accounts",
+        "CREATE TRIGGER IF NOT EXISTS accounts_insert AFTER INSERT ON accounts BEGIN"
+        " UPDATE totals SET total = total + NEW.balance, count = count + 1 WHERE id = 0; END",
+        "CREATE TRIGGER IF NOT EXISTS accounts_update AFTER UPDATE OF balance ON accounts BEGIN"
+        " UPDATE totals SET total = total + NEW.balance - OLD.balance WHERE id = 0; END",
+        "CREATE TRIGGER IF NOT EXISTS accounts_delete AFTER DELETE ON accounts BEGIN"
+        " UPDATE totals SET total = total - OLD.balance, count = count - 1 WHERE id = 0; END",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    )
+    SQL_GET = "SELECT balance FROM accounts WHERE number = ?"
+    SQL_UPSERT = ("INSERT INTO accounts (number, balance) VALUES (?, ?)"
+                  " ON CONFLICT (number) DO UPDATE SET balance = excluded.balance")
+    SQL_DELETE = "DELETE FROM accounts WHERE number = ?"
+    SQL_TOTALS = "SELECT total, count FROM totals WHERE id = 0"
+    SQL_ALL = "SELECT number, balance FROM accounts"
+    SQL_META_GET = "SELECT value FROM meta WHERE key = ?"
+    SQL_META_SET = ("INSERT INTO meta (key, value) VALUES (?, ?)"
+                    " ON CONFLICT (key) DO UPDATE SET value = excluded.value")
+
+    def __init__(self, filename, busy_timeout=5.0, durability="strict", compact_interval=30.0):
+        self.filename = filename
+        self.busy_timeout = busy_timeout
+        self.compact_interval = compact_interval
+        # SQLite nemá group commit s čekáním na fsync; "group" = FULL jako "strict"
+        self._synchronous = "NORMAL" if durability == "relaxed" else "FULL"
+        self._local = threading.local()
+        self._connections = set()  # Otevřená spojení živých vláken (kvůli close)
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._commit_time = metrics.histogram("bank_sqlite_commit_seconds", "Doba commitu transakce v SQLite")
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        with self._transaction(conn):
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+
+        # Stav alokátoru čísel AC je v tabulce meta
+        row = conn.execute(self.SQL_META_GET, ("allocator",)).fetchone()
+        self.allocator = AccountAllocator(state=json.loads(row[0]) if row else None)
+        self.allocator.load(number for number, in conn.execute("SELECT number FROM accounts"))
+        log.info("SQLite úložiště %s: %d účtů.", filename, self.totals()[1])
+
+        self._stop_event = threading.Event()
+        self._compactor = threading.Thread(target=self._compact_loop, name="sqlite-compact",
+                                           daemon=True)
+        self._compactor.start()
+
+    def _conn(self):
+        """
+        Spojení patřící aktuálnímu vláknu (vytvoří se při prvním použití).
+        Po skončení vlákna se zavře (vlákno na klienta by jinak nechávalo
+        otevřené soubory, dokud nedojde limit deskriptorů).
+        """
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            # isolation_level=None: transakce řídíme sami (BEGIN IMMEDIATE)
+            conn = sqlite3.connect(self.filename, timeout=self.busy_timeout,
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute(f"PRAGMA synchronous={self._synchronous}")
+            holder = self._local.holder = _ThreadConnection(conn)
+            with self._connections_lock:
+                self._connections.add(conn)
+            # Thread-local se uvolní s koncem vlákna -> finalize spojení zavře
+            weakref.finalize(holder, self._release, conn)
+        return holder.conn
+
+    def _release(self, conn):
+        with self._connections_lock:
+            self._connections.discard(conn)
+        conn.close()
+
+    @contextmanager
+    def _transaction(self, conn):
+        # SQLite pustí jen jednoho zapisovatele; vlákna tohoto procesu řadíme
+        # zámkem, jinak by čekala v busy handleru SQLite (uspávání po ms)
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            started = time.perf_counter()
+            conn.execute("COMMIT")
+            self._commit_time.observe(time.perf_counter() - started)
+
+    # --- ČTENÍ ---
+
+    def get(self, acc_num, default=None):
+        row = self._conn().execute(self.SQL_GET, (acc_num,)).fetchone()
+        return default if row is None else row[0]
+
+    def snapshot(self):
+        return dict(self._conn().execute(self.SQL_ALL))
+
+    def totals(self):
+        return tuple(self._conn().execute(self.SQL_TOTALS).fetchone())
+
+    # --- TRANSAKCE ---
+
+    def _write(self, conn, txn):
+        if txn.exists:
+            conn.execute(self.SQL_UPSERT, (txn.acc_num, txn.balance))
+        else:
+            conn.execute(self.SQL_DELETE, (txn.acc_num,))
+
+    def _track(self, txns):
+        """Po úspěšném COMMIT promítne založené/smazané účty do alokátoru."""
+        for txn in txns:
+            if txn.original_balance is None and txn.exists:
+                self.allocator.mark_used(txn.acc_num)
+            elif txn.original_balance is not None and not txn.exists:
+                self.allocator.release(txn.acc_num)
+
+    @contextmanager
+    def account(self, acc_num):
+        """Atomická transakce nad jedním účtem (BEGIN IMMEDIATE ... COMMIT)."""
+        conn = self._conn()
+        with self._transaction(conn):
+            txn = AccountTransaction(acc_num, self.get(acc_num))
+            yield txn
+            if txn.changed:
+                self._write(conn, txn)
+        self._track([txn])
+
+    @contextmanager
+    def accounts(self, acc_nums):
+        """Atomická transakce nad více účty - jeden COMMIT pro všechny změny."""
+        conn = self._conn()
+        with self._transaction(conn):
+            txns = {acc_num: AccountTransaction(acc_num, self.get(acc_num))
+                    for acc_num in acc_nums}
+            yield txns
+            for txn in txns.values():
+                if txn.changed:
+                    self._write(conn, txn)
+        self._track(txns.values())
+
+    def import_accounts(self, data, replace=False):
+        """
+        Hromadně vloží účty {cislo: zustatek} jednou transakcí (migrace z JSON).
+        Bez replace selže (ValueError), pokud už úložiště nějaké účty obsahuje.
+        """
+        conn = self._conn()
+        with self._transaction(conn):
+            if not replace and self.totals()[1]:
+                raise ValueError(f"{self.filename} už obsahuje účty")
+            conn.executemany(self.SQL_UPSERT, ((str(acc_num), int(balance))
+                                               for acc_num, balance in data.items()))
+        self.allocator.load(str(acc_num) for acc_num in data)
+
+    # --- ÚDRŽBA ---
+
+    def compact(self):
+        """Uloží stav alokátoru, přenese WAL SQLite do hlavního souboru a zkrátí ho."""
+        conn = self._conn()
+        with self._transaction(conn):
+            conn.execute(self.SQL_META_SET, ("allocator", json.dumps(self.allocator.state())))
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _compact_loop(self):
+        while not self._stop_event.wait(self.compact_interval):
+            try:
+                self.compact()
+            except sqlite3.Error as e:
+                log.error("Kompakce SQLite selhala: %s", e)
+
+    def close(self):
+        self._stop_event.set()
+        self._compactor.join()
+        try:
+            self.compact()
+        except sqlite3.Error as e:
+            log.warning("Checkpoint SQLite selhal: %s", e)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+ENGINES = ("ledger", "sqlite")
+
+
+def open_storage(filename, engine="ledger", shards=0, durability="strict"):
+    """
+    Vytvoří úložiště podle konfigurace:
+    - "ledger": JSON snapshot + WAL (LedgerStorage), při shards > 1 rozdělené
+      mezi více procesů (ShardedStorage),
+    - "sqlite": databáze SQLite (SqliteStorage).
+    durability: "strict" / "group" / "relaxed" (viz LedgerStorage).
+    """
+    if durability not in LedgerStorage.DURABILITY_MODES:
+        raise ValueError(f"Neznámý režim durability: {durability}")
+    if engine == "sqlite":
+        return SqliteStorage(filename, durability=durability)
+    if engine != "ledger":
+        raise ValueError(f"Neznámý engine úložiště: {engine}")
+    if shards > 1:
+        return ShardedStorage(filename, shards, durability=durability)
+    prepare_ledger_files(filename, shards)  # Návrat ze shard zpět na jeden soubor
+    return LedgerStorage(filename, durability=durability)